@@ -1,10 +1,15 @@
+from django.utils.decorators import method_decorator
 from django.views.generic.base import TemplateView
 
+from core.page_cache import tagged_page
 
+
+@method_decorator(tagged_page(), name='dispatch')
 class AboutAuthorView(TemplateView):
     template_name = 'about/author.html'
     # title = "Об авторе проекта"
 
 
+@method_decorator(tagged_page(), name='dispatch')
 class AboutTechView(TemplateView):
     template_name = 'about/tech.html'
@@ -0,0 +1,126 @@
+"""Версионированные теги кэша.
+
+У каждого тега (``feed:index``, ``author:5``…) в кэше лежит номер версии.
+Запись в кэше хранит версии своих тегов, поэтому ``bump_tags``
+мгновенно делает устаревшими все зависящие от тега записи, не перебирая
+их. Начальная версия берётся из часов: если счётчик
+вытеснят из кэша, новая версия не совпадёт ни с одной из старых.
+
+Записи лежат под стабильным ключом и переживают свой срок на
+``CACHE_STALE_TTL``.
+Пересчитывает устаревшую запись один процесс — взявший блокировку
+``cache.add`` (single-flight); остальные тем временем получают
+устаревшее значение (stale-while-revalidate), а если его нет — недолго
+ждут свежего. Значение считается с основной базы, а не с отстающей
+реплики (``core.replicas``).
+"""
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import replicas
+
+VERSION_PREFIX = 'tag-version:'
+LOCK_PREFIX = 'lock:'
+# упавший пересчёт не держит блокировку дольше
+LOCK_TIMEOUT = 30
+WAIT_STEP = 0.05
+
+
+def _initial_version():
+    return int(time.time() * 1000)
+
+
+def tag_versions(tags):
+    keys = {VERSION_PREFIX + tag: tag for tag in tags}
+    found = cache.get_many(keys)
+    versions = {keys[key]: value for key, value in found.items()}
+    for key, tag in keys.items():
+        if tag not in versions:
+            cache.add(key, _initial_version(), timeout=None)
+            versions[tag] = cache.get(key)
+    return versions
+
+
+def bump_tags(*tags):
+    for tag in tags:
+        key = VERSION_PREFIX + tag
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+
+
+def make_entry(value, versions, timeout):
+    expires = None if timeout is None else time.time() + timeout
+    return {'value': value, 'versions': versions, 'expires': expires}
+
+
+def store_entry(key, entry, timeout):
+    if timeout is not None:
+        timeout += settings.CACHE_STALE_TTL
+    cache.set(key, entry, timeout)
+
+
+def is_fresh(entry, versions=None):
+    """Не истекла ли запись и не сдвинулись ли версии её тегов."""
+    if entry is None:
+        return False
+    if entry['expires'] is not None and entry['expires'] <= time.time():
+        return False
+    if versions is None:
+        versions = tag_versions(list(entry['versions']))
+    return entry['versions'] == versions
+
+
+@contextmanager
+def single_flight(key):
+    """Блокировка пересчёта ``key``, общая для всех процессов.
+
+    Отдаёт ``True``, если пересчитывать выпало этому процессу.
+    """
+    lock = LOCK_PREFIX + key
+    acquired = cache.add(lock, 1, LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(lock)
+
+
+def wait_fresh(key):
+    """Ждёт, пока другой процесс запишет свежее значение ``key``."""
+    deadline = time.monotonic() + settings.CACHE_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if is_fresh(entry):
+            return entry
+    return None
+
+
+def get_or_compute(key, tags, compute, timeout):
+    """Значение ``key``, свежее для версий ``tags``, с single-flight."""
+    versions = tag_versions(tags)
+    entry = cache.get(key)
+    if is_fresh(entry, versions):
+        return entry['value']
+    with single_flight(key) as acquired:
+        if not acquired:
+            if entry is not None:
+                return entry['value']
+            entry = wait_fresh(key)
+            if entry is not None:
+                return entry['value']
+        # отстающая реплика закрепила бы старое под свежими версиями
+        with replicas.primary_reads():
+            value = compute()
+        store_entry(key, make_entry(value, versions, timeout), timeout)
+    return value
+
+
+def is_cached(key, tags):
+    """Лежит ли в кэше свежее значение ``key``."""
+    return is_fresh(cache.get(key), tag_versions(tags))
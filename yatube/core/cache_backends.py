@@ -0,0 +1,242 @@
+"""Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+В отличие от ``LocMemCache`` записи и инвалидации видны всем
+WSGI-воркерам, а внешних сервисов не нужно. Файл работает в режиме WAL:
+читатели не блокируют писателя. При превышении ``MAX_ENTRIES``
+вытесняются давно не читавшиеся записи (LRU), ``incr``/``decr`` атомарны
+между процессами за счёт ``BEGIN IMMEDIATE``.
+
+LRU приблизительный, чтобы чтение почти никогда не было записью: время
+обращения обновляется, только если оно старше ``ACCESS_RESOLUTION``
+секунд. Размер таблицы проверяется не при каждой записи, а с
+вероятностью ``CULL_PROBABILITY``, так что ``MAX_ENTRIES`` может
+ненадолго превышаться.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'ACCESS_RESOLUTION': 60, 'CULL_PROBABILITY': 0.01},
+        }
+    }
+"""
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ')',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._access_resolution = float(
+            options.get('ACCESS_RESOLUTION', 60)
+        )
+        self._cull_probability = float(options.get('CULL_PROBABILITY', 0.01))
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # соединение своё у каждого потока и у каждого процесса после fork
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                local.connection.execute(statement)
+            local.pid = os.getpid()
+        return local.connection
+
+    @contextmanager
+    def _write(self):
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _live(self, key):
+        row = self._connection.execute(
+            'SELECT value FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self._write() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (key, self._dumps(value), self._expires(timeout), now),
+            ).rowcount
+            if added:
+                self._maybe_cull(connection, now)
+        return bool(added)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        now = time.time()
+        placeholders = ', '.join('?' * len(made))
+        rows = self._connection.execute(
+            'SELECT key, value, accessed FROM cache'
+            f' WHERE key IN ({placeholders})'
+            ' AND (expires IS NULL OR expires > ?)',
+            (*made, now),
+        ).fetchall()
+        stale = now - self._access_resolution
+        touched = [key for key, _, accessed in rows if accessed < stale]
+        if touched:
+            self._connection.execute(
+                'UPDATE cache SET accessed = ?'
+                f' WHERE key IN ({", ".join("?" * len(touched))})'
+                ' AND accessed < ?',
+                (now, *touched, stale),
+            )
+        return {made[key]: pickle.loads(value) for key, value, _ in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, self._dumps(value), expires, now))
+        if not rows:
+            return []
+        with self._write() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', rows
+            )
+            self._maybe_cull(connection, now)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._write() as connection:
+            return bool(connection.execute(
+                'UPDATE cache SET expires = ? WHERE key = ?'
+                ' AND (expires IS NULL OR expires > ?)',
+                (self._expires(timeout), key, time.time()),
+            ).rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._write() as connection:
+            row = self._live(key)
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (self._dumps(value), time.time(), key),
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._live(key) is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        if keys:
+            with self._write() as connection:
+                connection.execute(
+                    'DELETE FROM cache'
+                    f' WHERE key IN ({", ".join("?" * len(keys))})',
+                    keys,
+                )
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # соединение живёт весь процесс: открывать файл на каждый запрос
+        # дороже, чем держать его
+        pass
+
+    def _maybe_cull(self, connection, now):
+        # COUNT(*) проходит всю таблицу: не на каждой записи
+        if random.random() < self._cull_probability:
+            self._cull(connection, now)
+
+    def _cull(self, connection, now):
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (now,)
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        excess = count - self._max_entries
+        if self._cull_frequency:
+            excess = max(excess, count // self._cull_frequency)
+        else:
+            excess = count
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?'
+            ')',
+            (excess,),
+        )
@@ -0,0 +1,50 @@
+"""Настройка соединений SQLite при открытии.
+
+Django открывает SQLite с умолчаниями библиотеки: журнал ``DELETE`` и
+``fsync`` на каждую запись, так что параллельные писатели быстро упираются
+в «database is locked». Обработчик ``connection_created`` выполняет на
+каждом новом соединении ``PRAGMA`` из ``settings.SQLITE_PRAGMAS``: WAL, в
+котором читатели не мешают писателю, ``synchronous=NORMAL``, ожидание
+блокировки вместо мгновенной ошибки, mmap и кэш страниц. Вместе с
+``CONN_MAX_AGE`` соединение и его настройки живут дольше одного запроса.
+"""
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+PRAGMAS = (
+    'journal_mode',
+    'synchronous',
+    'busy_timeout',
+    'mmap_size',
+    'cache_size',
+    'temp_store',
+)
+VALUE = re.compile(r'^-?\w+$')
+
+
+def pragma_statements(pragmas):
+    """``PRAGMA name=value`` для известных имён; значения проверяются."""
+    statements = []
+    for name, value in pragmas.items():
+        if name not in PRAGMAS:
+            raise ImproperlyConfigured(f'Неизвестная PRAGMA SQLite: {name}')
+        if not VALUE.match(str(value)):
+            raise ImproperlyConfigured(
+                f'Недопустимое значение PRAGMA {name}: {value!r}'
+            )
+        statements.append(f'PRAGMA {name}={value}')
+    return statements
+
+
+def apply_pragmas(cursor, pragmas):
+    for statement in pragma_statements(pragmas):
+        cursor.execute(statement)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.replicas import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет SQLite-реплики из DATABASE_REPLICAS копией основной '
+        'базы через онлайн-бэкап.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every',
+            type=float,
+            default=0,
+            help='Повторять каждые N секунд; по умолчанию один раз.',
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=1024,
+            help='Сколько страниц копировать за один шаг бэкапа.',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write('Реплики не настроены (YATUBE_DB_REPLICAS).')
+            return
+        source = settings.DATABASES['default']['NAME']
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                refresh(
+                    source,
+                    settings.DATABASES[alias]['NAME'],
+                    pages=options['pages'],
+                )
+                self.stdout.write(f'{alias}: обновлена')
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,114 @@
+import multiprocessing
+import shutil
+import sqlite3
+import tempfile
+import time
+from os import path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas
+
+SCHEMA = (
+    'CREATE TABLE post ('
+    ' id INTEGER PRIMARY KEY, comment_count INTEGER, updated_at REAL)',
+    'CREATE TABLE comment ('
+    ' id INTEGER PRIMARY KEY, post_id INTEGER, text TEXT, created REAL)',
+    'CREATE INDEX comment_post ON comment (post_id, created)',
+    'INSERT INTO post VALUES (1, 0, 0)',
+)
+
+
+def add_comment(connection):
+    """Те же записи, что делает ``add_comment`` с сигналами."""
+    now = time.time()
+    connection.execute('SELECT id FROM post WHERE id = 1').fetchone()
+    connection.execute(
+        'INSERT INTO comment (post_id, text, created) VALUES (1, ?, ?)',
+        ('Комментарий ' * 20, now),
+    )
+    connection.execute(
+        'UPDATE post SET comment_count = comment_count + 1, updated_at = ?'
+        ' WHERE id = 1',
+        (now,),
+    )
+
+
+def writer(location, pragmas, persistent, seconds):
+    """Пишет до дедлайна; возвращает (запросов, ошибок блокировки)."""
+    done = locked = 0
+    connection = None
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            if connection is None:
+                connection = sqlite3.connect(location, isolation_level=None)
+                apply_pragmas(connection, pragmas)
+            add_comment(connection)
+            done += 1
+        except sqlite3.OperationalError:
+            locked += 1
+        if not persistent and connection is not None:
+            connection.close()
+            connection = None
+    return done, locked
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность параллельных писателей SQLite '
+        'с настройками по умолчанию и с SQLITE_PRAGMAS и CONN_MAX_AGE.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=4,
+            help='Сколько процессов пишут одновременно.',
+        )
+        parser.add_argument(
+            '--seconds',
+            type=float,
+            default=3.0,
+            help='Сколько длится каждый прогон.',
+        )
+
+    def handle(self, *args, **options):
+        modes = (
+            # голый sqlite3: соединение на запрос, умолчания библиотеки
+            ('по умолчанию', {}, False),
+            ('с настройками', settings.SQLITE_PRAGMAS, True),
+        )
+        rates = []
+        for name, pragmas, persistent in modes:
+            done, locked = self.run(pragmas, persistent, options)
+            rate = done / options['seconds']
+            rates.append(rate)
+            self.stdout.write(
+                f'{name}: {done} запросов, {rate:.0f}/с, '
+                f'ошибок блокировки: {locked}'
+            )
+        if rates[0]:
+            self.stdout.write(f'Ускорение: {rates[1] / rates[0]:.1f}x')
+
+    def run(self, pragmas, persistent, options):
+        directory = tempfile.mkdtemp()
+        try:
+            location = path.join(directory, 'bench.sqlite3')
+            with sqlite3.connect(location) as connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            connection.close()
+            arguments = [
+                (location, pragmas, persistent, options['seconds'])
+            ] * options['writers']
+            with multiprocessing.Pool(options['writers']) as pool:
+                results = pool.starmap(writer, arguments)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return (
+            sum(done for done, _ in results),
+            sum(locked for _, locked in results),
+        )
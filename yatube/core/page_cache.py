@@ -0,0 +1,162 @@
+"""Кэш целых страниц для анонимных читателей.
+
+Анонимом считается запрос без сессионной куки: такой запрос отдаётся из
+кэша ещё до сессий, аутентификации и шаблонов. Вьюха разрешает кэшировать
+свой ответ вызовом ``tag_page(request, *теги)`` (или декоратором
+``tagged_page``) и перечисляет теги, от которых он зависит
+(``post:1``, ``author:2``, ``group:3``, ``feed:index``). Запись страницы
+хранит версии этих тегов и считается живой, пока они не изменились, а
+сигналы моделей двигают версии через ``bump_tags`` — так запись о посте
+сбрасывает ровно те страницы, где он виден.
+
+Промах по устаревшей странице пересчитывает один процесс
+(``single_flight``), остальные отдают устаревшую копию или ждут свежую.
+Ждут только адреса, которые уже сохранялись в кэш: страницы без
+``tag_page`` (логин, медиа, 404, редиректы) рендерятся сразу.
+
+Страница, которая может попасть в кэш, читается с основной базы: копия
+с отстающей реплики закрепилась бы под уже сдвинутыми версиями тегов.
+
+Для кэша перед приложением ответ получает ``Surrogate-Key`` со списком
+тегов и ``Cache-Control`` с ``s-maxage``. Слой включается настройкой
+``PAGE_CACHE_ENABLED`` и работает только с общим для процессов кэшем.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import parse_http_date_safe
+
+from . import replicas
+from .cache import (is_fresh, make_entry, single_flight, store_entry,
+                    tag_versions, wait_fresh)
+
+PAGE_PREFIX = 'page:'
+# адрес хоть раз сохранялся: его промахи стоит склеивать
+CACHEABLE_PREFIX = 'page-cacheable:'
+
+
+def is_anonymous(request):
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def _cacheable(request):
+    return (
+        settings.PAGE_CACHE_ENABLED
+        and request.method in ('GET', 'HEAD')
+        and is_anonymous(request)
+    )
+
+
+def tag_page(request, *tags):
+    """Разрешает закэшировать ответ для анонимов, помечая его тегами.
+
+    Версии тегов снимаются сейчас, до чтения данных: запись, случившаяся
+    во время рендера, сделает страницу устаревшей, а не закрепит старое.
+    """
+    request.page_cache_tags = tags
+    if _cacheable(request):
+        request.page_cache_versions = tag_versions(tags)
+
+
+def tagged_page(*tags):
+    """``tag_page`` для вьюх, теги которых известны заранее."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            tag_page(request, *tags)
+            return view(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def _key(request):
+    url = request.build_absolute_uri().encode()
+    return PAGE_PREFIX + hashlib.md5(url).hexdigest()
+
+
+def _storable(request, response):
+    return (
+        hasattr(request, 'page_cache_versions')
+        and response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not replicas.used_replica()
+    )
+
+
+def _restore(entry):
+    page = entry['value']
+    response = HttpResponse(page['content'], status=page['status'])
+    for header, value in page['headers']:
+        response[header] = value
+    return response
+
+
+def _conditional(request, response):
+    return get_conditional_response(
+        request,
+        etag=response.get('ETag'),
+        last_modified=parse_http_date_safe(
+            response.get('Last-Modified', '')
+        ),
+        response=response,
+    )
+
+
+class PageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _cacheable(request):
+            return self.get_response(request)
+        key = _key(request)
+        entry = cache.get(key)
+        if is_fresh(entry):
+            return _conditional(request, _restore(entry))
+        if entry is None and not cache.get(CACHEABLE_PREFIX + key):
+            # ждать нечего: такую страницу никто не сохранял
+            return self.render(key, request)
+        with single_flight(key) as acquired:
+            if not acquired:
+                entry = entry or wait_fresh(key)
+                if entry is not None:
+                    return _conditional(request, _restore(entry))
+            return self.render(key, request)
+
+    def render(self, key, request):
+        # кэшируемую страницу читаем с основной базы, а не с реплики
+        with replicas.primary_reads():
+            response = self.get_response(request)
+        if _storable(request, response):
+            self.store(key, request, response)
+        else:
+            cache.delete(CACHEABLE_PREFIX + key)
+        return response
+
+    def store(self, key, request, response):
+        tags = request.page_cache_tags
+        if tags:
+            response['Surrogate-Key'] = ' '.join(tags)
+        patch_cache_control(
+            response, public=True, max_age=0,
+            s_maxage=settings.PAGE_CACHE_SHARED_MAX_AGE,
+        )
+        page = {
+            'status': response.status_code,
+            'headers': list(response.items()),
+            'content': response.content,
+        }
+        timeout = settings.PAGE_CACHE_TIMEOUT
+        store_entry(
+            key,
+            make_entry(page, request.page_cache_versions, timeout),
+            timeout,
+        )
+        cache.set(CACHEABLE_PREFIX + key, 1, timeout=None)
@@ -0,0 +1,122 @@
+"""Чтение с реплик базы и закрепление за основной после записи.
+
+``ReplicaRouter`` отправляет чтения моделей из ``REPLICA_APPS`` на одну
+из реплик ``DATABASE_REPLICAS``, но только внутри GET/HEAD-запроса, в
+котором ``ReplicaPinMiddleware`` разрешил реплики. Записи, команды
+управления и всё остальное идут в ``default``.
+
+Реплика отстаёт от основной базы, поэтому ответ на POST ставит куку
+``REPLICA_PIN_COOKIE`` на ``REPLICA_PIN_SECONDS``: пока она жива,
+запросы этого клиента читают с основной базы и видят свои же посты и
+комментарии.
+
+Тегированные кэши (``core.cache``, ``core.page_cache``) снимают уже
+сдвинутые версии тегов, поэтому страница или фрагмент, прочитанные с
+отстающей реплики, закрепились бы в кэше как свежие. Всё, что может
+попасть в такой кэш, читается с основной базы (``primary_reads``);
+страница, которая всё же читала с реплики (``used_replica``), в кэш
+страниц не кладётся.
+
+Локально реплика — копия SQLite-файла, которую ``manage.py
+refresh_replicas`` обновляет онлайн-бэкапом (``refresh``) без остановки
+записи в основную базу.
+"""
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+def replicas_allowed():
+    return getattr(_state, 'replicas_allowed', False)
+
+
+def used_replica():
+    """Читал ли текущий запрос хоть что-то с реплики."""
+    return getattr(_state, 'used_replica', False)
+
+
+@contextmanager
+def primary_reads():
+    """Чтения внутри блока идут в основную базу."""
+    allowed = replicas_allowed()
+    _state.replicas_allowed = False
+    try:
+        yield
+    finally:
+        _state.replicas_allowed = allowed
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            settings.DATABASE_REPLICAS
+            and replicas_allowed()
+            and model._meta.app_label in settings.REPLICA_APPS
+        ):
+            _state.used_replica = True
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии основной базы, связи между ними допустимы
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = settings.REPLICA_PIN_COOKIE in request.COOKIES
+        _state.replicas_allowed = (
+            request.method in SAFE_METHODS and not pinned
+        )
+        _state.used_replica = False
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.replicas_allowed = False
+            _state.used_replica = False
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+def refresh(source, target, pages=1024):
+    """Копирует SQLite-базу ``source`` в ``target`` онлайн-бэкапом.
+
+    Бэкап идёт порциями по ``pages`` страниц и не держит блокировку
+    основной базы всё время копирования; читатели реплики видят либо
+    старую, либо новую копию целиком.
+    """
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        source_connection.backup(target_connection, pages=pages)
+    finally:
+        target_connection.close()
+        source_connection.close()
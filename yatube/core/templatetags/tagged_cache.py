@@ -0,0 +1,40 @@
+from django import template
+
+from core.cache import get_or_compute
+
+register = template.Library()
+
+
+class TaggedCacheNode(template.Node):
+    def __init__(self, nodelist, spec):
+        self.nodelist = nodelist
+        self.spec = spec
+
+    def render(self, context):
+        spec = self.spec.resolve(context)
+        if not spec:
+            return self.nodelist.render(context)
+        return get_or_compute(
+            spec['key'],
+            spec['tags'],
+            lambda: self.nodelist.render(context),
+            spec['timeout'],
+        )
+
+
+@register.tag
+def tagged_cache(parser, token):
+    """Кэширует фрагмент по ``{'key', 'tags', 'timeout'}`` с single-flight.
+
+    Пустая спецификация рендерит фрагмент без кэша.
+
+        {% tagged_cache feed_cache %}...{% endtagged_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            "'tagged_cache' принимает один аргумент"
+        )
+    nodelist = parser.parse(('endtagged_cache',))
+    parser.delete_first_token()
+    return TaggedCacheNode(nodelist, parser.compile_filter(bits[1]))
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import LOCK_PREFIX, bump_tags, get_or_compute
+
+
+class Counter:
+    def __init__(self, delay=0):
+        self.calls = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.delay)
+        return f'value {calls}'
+
+
+class GetOrComputeTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get(self, compute, timeout=60):
+        return get_or_compute('key', ['tag'], compute, timeout)
+
+    def test_fresh_value_is_not_recomputed(self):
+        compute = Counter()
+        self.assertEqual(self.get(compute), 'value 1')
+        self.assertEqual(self.get(compute), 'value 1')
+        bump_tags('tag')
+        self.assertEqual(self.get(compute), 'value 2')
+
+    def test_concurrent_misses_compute_once(self):
+        compute = Counter(delay=0.2)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.get(compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(results, ['value 1'] * 8)
+
+    def test_stale_value_served_while_another_recomputes(self):
+        compute = Counter()
+        self.get(compute, timeout=0.05)
+        time.sleep(0.1)
+        bump_tags('tag')
+        cache.add(LOCK_PREFIX + 'key', 1)
+        self.assertEqual(self.get(compute), 'value 1')
+        self.assertEqual(compute.calls, 1)
+        cache.delete(LOCK_PREFIX + 'key')
+        self.assertEqual(self.get(compute), 'value 2')
+
+    @override_settings(CACHE_WAIT_TIMEOUT=0.1)
+    def test_gives_up_waiting_for_a_stuck_lock(self):
+        cache.add(LOCK_PREFIX + 'key', 1)
+        self.assertEqual(self.get(Counter()), 'value 1')
@@ -0,0 +1,96 @@
+import multiprocessing
+import shutil
+import tempfile
+import time
+from os import path
+
+from django.test import SimpleTestCase
+
+from core.cache_backends import SQLiteCache
+
+
+def make_cache(location, **options):
+    return SQLiteCache(location, {'OPTIONS': options})
+
+
+def hammer(location, rounds):
+    cache = make_cache(location)
+    for _ in range(rounds):
+        cache.incr('counter')
+        cache.add('first', multiprocessing.current_process().name)
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = path.join(self.directory, 'cache.sqlite3')
+        self.cache = make_cache(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        self.cache.set('a', {'x': 1})
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertTrue(self.cache.add('b', 2))
+        self.cache.set_many({'c': 3, 'd': 4})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c', 'missing']),
+            {'a': {'x': 1}, 'b': 2, 'c': 3},
+        )
+        self.assertEqual(self.cache.incr('b', 5), 7)
+        self.assertEqual(self.cache.decr('b'), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.delete_many(['a', 'b'])
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_expired_entries_are_invisible(self):
+        self.cache.set('a', 1, timeout=0.05)
+        time.sleep(0.1)
+        self.assertFalse(self.cache.has_key('a'))
+        self.assertTrue(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = make_cache(
+            self.location, MAX_ENTRIES=3, CULL_FREQUENCY=3,
+            ACCESS_RESOLUTION=0, CULL_PROBABILITY=1,
+        )
+        for key in 'abc':
+            cache.set(key, key)
+            time.sleep(0.01)
+        cache.get('a')
+        time.sleep(0.01)
+        cache.set('d', 'd')
+        self.assertEqual(
+            sorted(cache.get_many('abcd')), ['a', 'c', 'd']
+        )
+
+    def test_recent_reads_do_not_write(self):
+        self.cache.set('a', 1)
+        connection = self.cache._connection
+        changes = connection.total_changes
+        for _ in range(3):
+            self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(connection.total_changes, changes)
+
+    def test_shared_between_processes(self):
+        """Счётчик и add атомарны при конкурентной записи из процессов."""
+        self.cache.set('counter', 0)
+        processes, rounds = 4, 50
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=hammer, args=(self.location, rounds))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(self.cache.get('counter'), processes * rounds)
+        self.assertIn(
+            self.cache.get('first'), [worker.name for worker in workers]
+        )
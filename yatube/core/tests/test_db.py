@@ -0,0 +1,49 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from core.db import pragma_statements
+
+
+class SQLitePragmaTest(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connections_are_tuned(self):
+        pragmas = settings.SQLITE_PRAGMAS
+        self.assertEqual(self.pragma('busy_timeout'), pragmas['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), pragmas['cache_size'])
+        # 2 — MEMORY
+        self.assertEqual(self.pragma('temp_store'), 2)
+
+
+class PragmaStatementsTest(SimpleTestCase):
+    def test_statements(self):
+        self.assertEqual(
+            pragma_statements({'journal_mode': 'WAL', 'cache_size': -2000}),
+            ['PRAGMA journal_mode=WAL', 'PRAGMA cache_size=-2000'],
+        )
+
+    def test_rejects_unknown_names_and_odd_values(self):
+        for pragmas in (
+            {'writable_schema': 1},
+            {'journal_mode': 'WAL; DROP TABLE posts_post'},
+        ):
+            with self.subTest(pragmas=pragmas):
+                with self.assertRaises(ImproperlyConfigured):
+                    pragma_statements(pragmas)
+
+
+class SQLiteBenchmarkTest(SimpleTestCase):
+    def test_reports_both_modes(self):
+        out = StringIO()
+        call_command('sqlite_benchmark', writers=2, seconds=0.2, stdout=out)
+        self.assertIn('по умолчанию:', out.getvalue())
+        self.assertIn('с настройками:', out.getvalue())
+        self.assertIn('Ускорение:', out.getvalue())
@@ -0,0 +1,147 @@
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+from os import path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.cache import get_or_compute
+from core.page_cache import PageCacheMiddleware
+from core.replicas import ReplicaPinMiddleware, ReplicaRouter, refresh
+from posts.cache import feed_key, feed_reads
+from posts.models import Post
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+        def view(request):
+            # какую базу роутер выбрал бы для чтения внутри запроса
+            return HttpResponse(self.router.db_for_read(Post) or 'default')
+
+        self.middleware = ReplicaPinMiddleware(view)
+
+    def test_reads_go_to_replicas_only_inside_get_requests(self):
+        self.assertEqual(
+            self.middleware(self.factory.get('/')).content, b'replica0'
+        )
+        self.assertEqual(
+            self.middleware(self.factory.post('/')).content, b'default'
+        )
+        self.assertIsNone(self.router.db_for_read(Post))
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_other_apps_stay_on_primary(self):
+        request = self.factory.get('/')
+        response = ReplicaPinMiddleware(
+            lambda request: HttpResponse(self.router.db_for_read(User))
+        )(request)
+        self.assertEqual(response.content, b'None')
+
+    def test_write_pins_client_to_primary(self):
+        response = self.middleware(self.factory.post('/'))
+        cookie = response.cookies['yatube_primary']
+        self.assertEqual(cookie['max-age'], 10)
+        request = self.factory.get('/')
+        request.COOKIES['yatube_primary'] = cookie.value
+        self.assertEqual(self.middleware(request).content, b'default')
+        self.assertNotIn(
+            'yatube_primary', self.middleware(self.factory.get('/')).cookies
+        )
+
+    def test_cached_values_are_computed_on_primary(self):
+        def view(request):
+            value = get_or_compute(
+                'replica-test', ['tag'],
+                lambda: self.router.db_for_read(Post) or 'default', 60,
+            )
+            return HttpResponse(value)
+
+        cache.clear()
+        response = ReplicaPinMiddleware(view)(self.factory.get('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(cache.get('replica-test')['value'], 'default')
+
+    def test_feed_reads_primary_until_fragment_is_cached(self):
+        def view(request):
+            with feed_reads(request, 'tag'):
+                return HttpResponse(self.router.db_for_read(Post))
+
+        cache.clear()
+        middleware = ReplicaPinMiddleware(view)
+        self.assertEqual(middleware(self.factory.get('/')).content, b'None')
+        get_or_compute(feed_key('tag', 'first'), ['tag'], lambda: '', 60)
+        self.assertEqual(
+            middleware(self.factory.get('/')).content, b'replica0'
+        )
+        self.assertEqual(
+            middleware(self.factory.get('/?page=2')).content, b'None'
+        )
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_cacheable_pages_read_from_primary(self):
+        response = ReplicaPinMiddleware(PageCacheMiddleware(
+            lambda request: HttpResponse(self.router.db_for_read(Post))
+        ))(self.factory.get('/'))
+        self.assertEqual(response.content, b'None')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica0', 'posts'))
+        self.assertIsNone(self.router.allow_migrate('default', 'posts'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_no_cookie(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertNotIn('yatube_primary', response.cookies)
+        self.assertEqual(
+            self.middleware(self.factory.get('/')).content, b'default'
+        )
+
+
+class RefreshReplicaTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = path.join(self.directory, 'db.sqlite3')
+        self.target = path.join(self.directory, 'replica.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def count(self, location):
+        connection = sqlite3.connect(location)
+        try:
+            return connection.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+        finally:
+            connection.close()
+
+    def test_refresh_copies_the_current_primary(self):
+        source = sqlite3.connect(self.source, isolation_level=None)
+        source.execute('PRAGMA journal_mode=WAL')
+        source.execute('CREATE TABLE t (x)')
+        source.execute('INSERT INTO t VALUES (1)')
+        refresh(self.source, self.target, pages=1)
+        self.assertEqual(self.count(self.target), 1)
+        # реплика со своим открытым соединением видит новую копию
+        reader = sqlite3.connect(self.target)
+        source.execute('INSERT INTO t VALUES (2)')
+        refresh(self.source, self.target)
+        self.assertEqual(
+            reader.execute('SELECT COUNT(*) FROM t').fetchone()[0], 2
+        )
+        reader.close()
+        source.close()
+
+    def test_command_without_replicas(self):
+        out = StringIO()
+        call_command('refresh_replicas', stdout=out)
+        self.assertIn('Реплики не настроены', out.getvalue())
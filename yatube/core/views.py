@@ -1,4 +1,22 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# sorl называет миниатюры md5, хранилище постов — sha256 содержимого
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{32,}\.\w+$')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MEDIA_MAX_AGE = 60 * 60
 
 
 def page_not_found(request, exception):
@@ -11,3 +29,117 @@ def csrf_failure(request, reason=''):
 
 def server_error(request):
     return render(request, 'core/500.html')
+
+
+def _byte_range(header, size):
+    """``(начало, конец)`` включительно или ``None`` — отдать весь файл.
+
+    Несколько диапазонов не поддерживаются: на них, как и на мусор,
+    отдаётся весь файл. Невыполнимый диапазон — ``ValueError``.
+    """
+    match = BYTE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+class _FileRange:
+    """Файл, который читается только от ``start`` до ``end`` включительно."""
+
+    def __init__(self, file, start, end):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = end - start + 1
+
+    def read(self, size):
+        data = self.file.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+@require_safe
+def media(request, path):
+    """Отдаёт загруженный файл из ``MEDIA_ROOT``.
+
+    За nginx/Apache (``MEDIA_ACCEL``) файл отдаёт прокси по заголовку
+    ``X-Accel-Redirect``/``X-Sendfile``; без него — потоком с поддержкой
+    Range. Ответ в обоих случаях условный (ETag, Last-Modified), а имена с
+    хэшем кэшируются навсегда.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+    last_modified = http_date(stat.st_mtime)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=stat.st_mtime
+    )
+    if response is None:
+        response = _serve(request, path, full_path, stat.st_size, etag,
+                          last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    if HASHED_NAME.search(path):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, max_age=MEDIA_MAX_AGE)
+    return response
+
+
+def _serve(request, path, full_path, size, etag, last_modified):
+    content_type = mimetypes.guess_type(full_path)[0]
+    accel = settings.MEDIA_ACCEL
+    if accel == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_PREFIX + quote(path)
+        )
+        return response
+    if accel == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if 'HTTP_RANGE' in request.META and if_range in (
+        None, etag, last_modified
+    ):
+        try:
+            byte_range = _byte_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'))
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            _FileRange(open(full_path, 'rb'), start, end),
+            status=206, filename=path,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.db import connection
 
+from . import search
 from .models import Post
 from .models import Group
 
@@ -11,6 +13,16 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # LIKE '%q%' по всей таблице заменяем запросом к индексу FTS5
+        if search.is_available(connection) and search.match_query(
+            search_term
+        ):
+            return queryset.filter(
+                pk__in=search.matching_ids(search_term)
+            ), False
+        return super().get_search_results(request, queryset, search_term)
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
@@ -0,0 +1,151 @@
+"""Архив старых постов: ``ArchivedPost`` и ``ArchivedComment``.
+
+``manage.py archive_posts --older-than ДНЕЙ`` пачками переносит посты
+старше срока вместе с комментариями в архивные таблицы той же базы (или
+того же шарда), так что горячие таблицы и их индексы остаются
+маленькими, а лента и группы читают только свежие посты.
+
+Перенос — не удаление: сигналы удаления на время переноса заглушены,
+счётчики автора и ссылки на файлы картинок не меняются, а
+``archived_post_count`` автора растёт. Страница поста при промахе по
+``Post`` читает архив, профиль после свежих постов автора продолжает
+его архивными (``with_archive``).
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from core.cache import bump_tags
+
+from . import stats
+from .cache import post_tags
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+
+_state = threading.local()
+
+
+def in_progress():
+    """Идёт перенос: сигналы удаления постов и комментариев молчат."""
+    return getattr(_state, 'moving', False)
+
+
+@contextmanager
+def moving():
+    _state.moving = True
+    try:
+        yield
+    finally:
+        _state.moving = False
+
+
+def _copy(model, row):
+    return model(**{
+        field.attname: getattr(row, field.attname)
+        for field in row._meta.concrete_fields
+    })
+
+
+def candidates(cutoff, using=None):
+    """Посты старше ``cutoff``, от самых старых."""
+    return (
+        Post.objects.using(using).filter(pub_date__lt=cutoff)
+        .order_by('pub_date', 'pk')
+    )
+
+
+def move(posts, using=None):
+    """Переносит пачку постов с комментариями в архив одной транзакцией.
+
+    Посты перечитываются под блокировкой записи: правка или удаление
+    между выборкой пачки и переносом не теряются. Удаляется ровно
+    скопированное в архив.
+    """
+    from .signals import touch_groups
+
+    post_ids = [post.pk for post in posts]
+    database = using or 'default'
+    with transaction.atomic(using=database):
+        # сначала запись: в WAL транзакция SQLite, начатая чтением, не
+        # может писать, если её обогнал другой писатель, а запись сразу
+        # ждёт блокировку (busy_timeout); в других базах это блокирует
+        # строки постов до конца переноса
+        Post.objects.using(database).filter(pk__in=post_ids).update(
+            updated_at=F('updated_at')
+        )
+        posts = list(Post.objects.using(database).filter(pk__in=post_ids))
+        post_ids = [post.pk for post in posts]
+        comments = list(
+            Comment.objects.using(database).filter(post_id__in=post_ids)
+        )
+        ArchivedPost.objects.using(database).bulk_create(
+            [_copy(ArchivedPost, post) for post in posts]
+        )
+        ArchivedComment.objects.using(database).bulk_create(
+            [_copy(ArchivedComment, comment) for comment in comments]
+        )
+        with moving():
+            Comment.objects.using(database).filter(
+                pk__in=[comment.pk for comment in comments]
+            ).delete()
+            Post.objects.using(database).filter(pk__in=post_ids).delete()
+    by_author = {}
+    for post in posts:
+        by_author[post.author_id] = by_author.get(post.author_id, 0) + 1
+    for author_id, count in by_author.items():
+        stats.bump(author_id, 'archived_post_count', count)
+    bump_tags(*{tag for post in posts for tag in post_tags(post)})
+    # посты пропали из лент групп: их ответы 304 должны смениться
+    touch_groups(*{post.group_id for post in posts})
+    return len(posts), len(comments)
+
+
+class TieredQuerySet:
+    """Свежие посты автора, за ними — архивные.
+
+    Архив автора целиком старше его свежих постов, поэтому срез сначала
+    берётся из горячей выборки и только при нехватке строк добирается из
+    архива (при обратном порядке — наоборот). Курсорной пагинации
+    достаточно ``filter``/``order_by``/срезов.
+    """
+
+    def __init__(self, hot, archived, ordering=()):
+        self.hot = hot
+        self.archived = archived
+        self.ordering = tuple(ordering)
+
+    def filter(self, *args, **kwargs):
+        return TieredQuerySet(
+            self.hot.filter(*args, **kwargs),
+            self.archived.filter(*args, **kwargs),
+            self.ordering,
+        )
+
+    def order_by(self, *ordering):
+        return TieredQuerySet(
+            self.hot.order_by(*ordering),
+            self.archived.order_by(*ordering),
+            ordering,
+        )
+
+    def count(self):
+        return self.hot.count() + self.archived.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.stop is None:
+            raise TypeError('Выборку с архивом можно только срезать')
+        tiers = (self.hot, self.archived)
+        if self.ordering and not self.ordering[0].startswith('-'):
+            tiers = tiers[::-1]
+        rows = list(tiers[0][:item.stop])
+        if len(rows) < item.stop:
+            rows += list(tiers[1][:item.stop - len(rows)])
+        return rows[item.start or 0:item.stop]
+
+
+def with_archive(posts, archived, author_stats):
+    """Выборка постов автора, продолженная архивом, если он у автора есть."""
+    if not author_stats.archived_post_count:
+        return posts
+    return TieredQuerySet(posts, archived)
@@ -0,0 +1,60 @@
+"""Теги кэша для лент постов."""
+import hashlib
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from core import replicas
+from core.cache import is_cached
+
+from .paginators import request_position
+
+INDEX_TAG = 'feed:index'
+
+
+def group_tag(group_id):
+    return f'group:{group_id}'
+
+
+def author_tag(author_id):
+    return f'author:{author_id}'
+
+
+def post_tag(post_id):
+    return f'post:{post_id}'
+
+
+def post_tags(post, group_id=None):
+    """Теги всех лент, в которых показывается пост."""
+    tags = [INDEX_TAG, author_tag(post.author_id), post_tag(post.pk)]
+    for group in {post.group_id, group_id} - {None}:
+        tags.append(group_tag(group))
+    return tags
+
+
+def feed_key(tag, position):
+    return f'feed:{tag}:{hashlib.md5(position.encode()).hexdigest()}'
+
+
+def feed_cache(tag, page_obj):
+    """Ключ, теги и время жизни фрагмента ленты для ``{% tagged_cache %}``.
+
+    Пустая страница не кэшируется (``None``): иначе она могла бы занять
+    ключ страницы, на которой посты есть.
+    """
+    if not page_obj:
+        return None
+    return {
+        'key': feed_key(tag, page_obj.position),
+        'tags': [tag],
+        'timeout': settings.FEED_CACHE_TIMEOUT,
+    }
+
+
+def feed_reads(request, tag):
+    """Откуда читать страницу ленты: с реплики, только если её фрагмент
+    уже в кэше, иначе с основной базы — фрагмент из неё попадёт в кэш.
+    """
+    if is_cached(feed_key(tag, request_position(request)), [tag]):
+        return nullcontext()
+    return replicas.primary_reads()
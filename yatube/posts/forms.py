@@ -1,8 +1,13 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+
+from . images import ImageTooLarge, ingest, log_timings
 from . models import Comment, Post
 
 
 class PostForm(forms.ModelForm):
+    ingest_timings = None
+
     class Meta:
         model = Post
         fields = ['text', 'group', 'image']
@@ -20,6 +25,19 @@ class PostForm(forms.ModelForm):
             ),
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            image, self.ingest_timings = ingest(image)
+        except ImageTooLarge:
+            raise forms.ValidationError(
+                'Картинка слишком большая.', code='too_large'
+            )
+        log_timings(image.name, self.ingest_timings)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,166 @@
+"""Работа с загруженными картинками постов."""
+import hashlib
+import logging
+import os
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+EXIF_ORIENTATION = 0x0112
+# форматы, в которых оригинал сохраняется как есть; прочие -> JPEG/PNG
+KEPT_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def content_hash(file):
+    """SHA-256 содержимого файла, читается кусками."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def read_metadata(file):
+    """Размеры, формат, объём и хэш картинки.
+
+    Pillow читает только заголовок, пиксели не декодируются.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        image_format = image.format or ''
+    metadata = {
+        'image_width': width,
+        'image_height': height,
+        'image_format': image_format,
+        'image_size': file.size,
+        'image_hash': content_hash(file),
+    }
+    return metadata
+
+
+EMPTY_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_format': '',
+    'image_size': None,
+    'image_hash': '',
+}
+
+
+class StoredImage:
+    """Оригинал картинки поста с размерами из модели.
+
+    В отличие от ``ImageFieldFile`` не открывает файл ради
+    ``width``/``height``: если размеры неизвестны, они равны ``None``.
+    """
+
+    def __init__(self, post):
+        self.name = post.image.name
+        self.url = post.image.url
+        self.width = post.image_width
+        self.height = post.image_height
+
+    def __str__(self):
+        return self.name
+
+
+def original(post):
+    return StoredImage(post) if post.image else None
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class Stopwatch:
+    """Длительность этапов обработки в миллисекундах."""
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = round((now - self._last) * 1000, 2)
+        self._last = now
+
+
+def ingest(upload):
+    """Готовит загруженную картинку к хранению: ``(файл, тайминги)``.
+
+    Размер проверяется по заголовку до декодирования (защита от
+    декомпрессионных бомб). Картинка без EXIF, не больше
+    ``IMAGE_MAX_SIDE``, сохраняется как есть; иначе она поворачивается по
+    EXIF, уменьшается и перекодируется без метаданных. JPEG декодируется
+    сразу в уменьшенном масштабе (``draft``), так что полный кадр
+    фотографии с телефона в память не попадает.
+    """
+    stopwatch = Stopwatch()
+    max_side = settings.IMAGE_MAX_SIDE
+    upload.seek(0)
+    with Image.open(upload) as image:
+        stopwatch.lap('open')
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(f'{width}x{height}')
+        has_exif = bool(image.info.get('exif')) or (
+            image.getexif().get(EXIF_ORIENTATION, 1) != 1
+        )
+        if getattr(image, 'is_animated', False) or (
+            not has_exif and max(width, height) <= max_side
+        ):
+            upload.seek(0)
+            return upload, stopwatch.timings
+        image_format = image.format
+        image.draft('RGB', (max_side, max_side))
+        image.load()
+        stopwatch.lap('decode')
+        image = ImageOps.exif_transpose(image)
+        stopwatch.lap('orient')
+        image.thumbnail(
+            (max_side, max_side), Image.LANCZOS, reducing_gap=3.0
+        )
+        stopwatch.lap('resize')
+    content, extension = _encode(image, image_format)
+    stopwatch.lap('encode')
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(content, name=f'{name}.{extension}'), (
+        stopwatch.timings
+    )
+
+
+def _encode(image, image_format):
+    for key in ('exif', 'comment'):
+        image.info.pop(key, None)
+    if image_format not in KEPT_FORMATS:
+        image_format = 'PNG' if 'A' in image.getbands() else 'JPEG'
+    options = {}
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        options = {
+            'quality': settings.IMAGE_JPEG_QUALITY,
+            'optimize': True,
+            'progressive': True,
+        }
+    buffer = BytesIO()
+    image.save(
+        buffer, image_format, icc_profile=image.info.get('icc_profile'),
+        **options
+    )
+    return buffer.getvalue(), KEPT_FORMATS[image_format]
+
+
+def log_timings(name, timings):
+    logger.info(
+        'ingest %s: %s', name,
+        ' '.join(f'{stage}={ms}ms' for stage, ms in timings.items()),
+    )
@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.utils import timezone
+
+from posts import archive, shards
+from posts.models import Post
+
+# сколько раз повторять пачку, упёршуюся в чужую блокировку записи
+LOCK_RETRIES = 3
+LOCK_RETRY_DELAY = 1
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые посты с комментариями в архивные таблицы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            required=True,
+            help='Архивировать посты старше стольких дней.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов переносить одной транзакцией.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать посты, которые уехали бы в архив.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        if options['dry_run']:
+            total = sum(
+                archive.candidates(cutoff, alias).count()
+                for alias in shards.aliases(Post)
+            )
+            self.stdout.write(f'Будет перенесено постов: {total}')
+            return
+        posts = comments = 0
+        for alias in shards.aliases(Post):
+            moved = self.archive(cutoff, alias, options['batch_size'])
+            posts += moved[0]
+            comments += moved[1]
+        self.stdout.write(
+            f'Перенесено постов: {posts}, комментариев: {comments}'
+        )
+
+    def archive(self, cutoff, alias, batch_size):
+        posts = comments = 0
+        while True:
+            # перенесённые посты из выборки пропадают, смещение не нужно
+            batch = list(archive.candidates(cutoff, alias)[:batch_size])
+            if not batch:
+                break
+            moved = self.move(batch, alias)
+            if moved is None:
+                # пачка вернётся в следующий запуск
+                break
+            posts += moved[0]
+            comments += moved[1]
+        return posts, comments
+
+    def move(self, batch, alias):
+        """Переносит пачку; ``None``, если база так и осталась занятой."""
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                return archive.move(batch, alias)
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                self.stderr.write(
+                    f'{alias}: {error} ({attempt}/{LOCK_RETRIES})'
+                )
+            if attempt < LOCK_RETRIES:
+                time.sleep(LOCK_RETRY_DELAY * attempt)
+        return None
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from posts import shards
+from posts.images import read_metadata
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры, формат и хэш картинок у старых постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов выбирать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        filled = missing = 0
+        for alias in shards.aliases(Post):
+            done = self.backfill(Post.objects.using(alias), options)
+            filled += done[0]
+            missing += done[1]
+        self.stdout.write(f'Заполнено: {filled}, недоступно: {missing}')
+
+    def backfill(self, posts, options):
+        pending = (
+            posts.exclude(image='').filter(image_hash='')
+            .order_by('pk').only('pk', 'image')
+        )
+        filled = missing = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                pending.filter(pk__gt=last_pk)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for post in batch:
+                try:
+                    with post.image.open('rb') as file:
+                        metadata = read_metadata(file)
+                except (OSError, ValueError):
+                    # файла нет или это не картинка — оставляем как есть
+                    missing += 1
+                    continue
+                posts.filter(pk=post.pk).update(**metadata)
+                filled += 1
+        return filled, missing
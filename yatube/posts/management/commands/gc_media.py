@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+from sorl.thumbnail.kvstores import cached_db_kvstore
+
+from posts import media
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы картинок, на которые не ссылается ни один пост, '
+        'и устаревшие миниатюры sorl.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов или записей KV обрабатывать за проход.',
+        )
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=int(media.GC_GRACE.total_seconds() // 60),
+            help='Не трогать файлы моложе этого возраста.',
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default.kvstore, cached_db_kvstore.KVStore):
+            raise CommandError('gc_media работает с cached_db KV-хранилищем')
+        dry_run = options['dry_run']
+        batch_size = options['batch_size']
+        grace = timedelta(minutes=options['grace_minutes'])
+        files = 0
+        for names in media.orphan_files(batch_size, grace):
+            files += len(names)
+            if dry_run or options['verbosity'] > 1:
+                for name in names:
+                    self.stdout.write(name)
+            if not dry_run:
+                media.delete_files(names)
+        thumbnails = 0
+        for stale in media.stale_thumbnails(batch_size):
+            thumbnails += sum(len(drop) for _, drop, _ in stale)
+            if not dry_run:
+                media.delete_thumbnails(stale, batch_size)
+        verb = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(
+            f'{verb} файлов: {files}, миниатюр: {thumbnails}'
+        )
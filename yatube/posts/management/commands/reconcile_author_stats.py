@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.cache import bump_tags
+from posts import stats
+from posts.cache import author_tag
+from posts.models import AuthorStats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики AuthorStats и исправляет расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько пользователей пересчитывать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        batch, fixed = [], 0
+        for user_id in user_ids.iterator():
+            batch.append(user_id)
+            if len(batch) == options['batch_size']:
+                fixed += self.reconcile(batch)
+                batch = []
+        if batch:
+            fixed += self.reconcile(batch)
+        self.stdout.write(f'Исправлено строк: {fixed}')
+
+    def reconcile(self, user_ids):
+        expected = stats.count_many(user_ids)
+        current = AuthorStats.objects.in_bulk(user_ids)
+        fixed = 0
+        for user_id, counters in expected.items():
+            row = current.get(user_id)
+            if row is None:
+                AuthorStats.objects.create(user_id=user_id, **counters)
+            elif any(getattr(row, f) != v for f, v in counters.items()):
+                # ETag профиля и постов автора считается от updated_at
+                AuthorStats.objects.filter(user_id=user_id).update(
+                    **counters, updated_at=timezone.now()
+                )
+            else:
+                continue
+            bump_tags(author_tag(user_id))
+            fixed += 1
+        return fixed
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import shards, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Фоновый воркер: нарезает миниатюры из очереди ThumbnailJob.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Разобрать очередь и выйти, не дожидаясь новых заданий.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Пауза между опросами пустой очереди, в секундах.',
+        )
+        parser.add_argument(
+            '--enqueue-existing',
+            action='store_true',
+            help='Поставить в очередь картинки всех уже сохранённых постов.',
+        )
+
+    def handle(self, *args, **options):
+        if options['enqueue_existing']:
+            for alias in shards.aliases(Post):
+                images = (
+                    Post.objects.using(alias).exclude(image='')
+                    .values_list('image', flat=True).distinct()
+                )
+                for image in images.iterator():
+                    thumbnails.enqueue(image)
+        processed = 0
+        while True:
+            job = thumbnails.claim()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            thumbnails.process(job)
+            processed += 1
+            self.stdout.write(f'{job.image}: {job.status}')
+        self.stdout.write(f'Обработано заданий: {processed}')
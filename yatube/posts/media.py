@@ -0,0 +1,191 @@
+"""Файлы картинок постов: счётчики ссылок и сборка мусора.
+
+Файл с адресацией по содержимому может принадлежать многим постам.
+Сигналы двигают счётчик в ``MediaFile`` атомарным ``UPDATE``;
+отсутствующая строка создаётся честным пересчётом.
+
+Файлы без ссылок удаляет ``manage.py gc_media``, а не запрос, удаливший
+последний пост: так повторная загрузка той же картинки в этот момент не
+останется без файла. Сборщик сверяет с ``Post.image`` сами файлы и
+KV-хранилище sorl, а не счётчики, и проходит обе стороны пачками, не
+держа их в памяти целиком. Картинки архивных постов тоже заняты.
+"""
+import os
+import time
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import thumbnails
+from .models import ArchivedPost, MediaFile, Post
+
+# загрузка пишет файл раньше, чем коммитится пост
+GC_GRACE = timedelta(hours=1)
+
+
+def recount(name):
+    # картинка архивного поста тоже занята
+    refs = sum(
+        model.objects.across_shards().filter(image=name).count()
+        for model in (Post, ArchivedPost)
+    )
+    media_file, _ = MediaFile.objects.update_or_create(
+        name=name, defaults={'refs': refs}
+    )
+    return media_file
+
+
+def retain(name):
+    if not name:
+        return
+    updated = MediaFile.objects.filter(name=name).update(
+        refs=F('refs') + 1, updated=timezone.now()
+    )
+    if not updated:
+        recount(name)
+
+
+def release(name):
+    if not name:
+        return
+    MediaFile.objects.filter(name=name, refs__gte=1).update(
+        refs=F('refs') - 1, updated=timezone.now()
+    )
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _walk(root):
+    """Файлы под ``root`` и их mtime; в памяти только стек каталогов."""
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path, entry.stat().st_mtime
+
+
+def _referenced(names):
+    return {
+        name for model in (Post, ArchivedPost)
+        for name in model.objects.across_shards().filter(image__in=names)
+        .values_list('image', flat=True)
+    }
+
+
+def orphan_files(batch_size=500, grace=GC_GRACE):
+    """Пачки имён файлов, на которые не ссылается ни один пост."""
+    field = Post._meta.get_field('image')
+    storage = field.storage
+    deadline = time.time() - grace.total_seconds()
+    names = (
+        os.path.relpath(path, storage.location).replace(os.sep, '/')
+        for path, mtime in _walk(storage.path(field.upload_to))
+        if mtime < deadline
+    )
+    for batch in _batches(names, batch_size):
+        referenced = _referenced(batch)
+        orphans = [name for name in batch if name not in referenced]
+        if orphans:
+            yield orphans
+
+
+def delete_files(names):
+    storage = Post._meta.get_field('image').storage
+    for name in names:
+        storage.delete(name)
+    MediaFile.objects.filter(name__in=names).delete()
+
+
+def stale_thumbnails(batch_size=500):
+    """Пачки ``(ключ исходника, лишние миниатюры, нужные миниатюры)``.
+
+    Миниатюра лишняя, если её исходник не нужен ни одному посту, записан
+    под ключом другого хранилища или её геометрии больше нет среди
+    ``thumbnails.geometries()``. Пустой список нужных значит, что запись
+    исходника в KV-хранилище больше не нужна.
+    """
+    prefix = add_prefix('', 'thumbnails')
+    wanted = thumbnails.geometries()
+    last = prefix
+    while True:
+        rows = list(
+            KVStoreModel.objects.filter(
+                key__startswith=prefix, key__gt=last
+            ).order_by('key').values_list('key', 'value')[:batch_size]
+        )
+        if not rows:
+            return
+        last = rows[-1][0]
+        lists = {del_prefix(key): deserialize(value) for key, value in rows}
+        sources = {
+            del_prefix(key): deserialize(value)['name']
+            for key, value in KVStoreModel.objects.filter(
+                key__in=[add_prefix(key) for key in lists]
+            ).values_list('key', 'value')
+        }
+        referenced = _referenced(set(sources.values()))
+        stale = []
+        for source_key, thumbnail_keys in lists.items():
+            name = sources.get(source_key)
+            keep = set()
+            if name in referenced and (
+                thumbnails.source_file(name).key == source_key
+            ):
+                keep = {
+                    thumbnails.thumbnail_file(name, geometry, options).key
+                    for geometry, options in wanted
+                }
+            drop = [key for key in thumbnail_keys if key not in keep]
+            if drop:
+                stale.append((
+                    source_key,
+                    drop,
+                    [key for key in thumbnail_keys if key in keep],
+                ))
+        if stale:
+            yield stale
+
+
+def delete_thumbnails(stale, batch_size=500):
+    """Удаляет файлы и записи лишних миниатюр пачками."""
+    kvstore = default.kvstore
+    dropped = [
+        add_prefix(key) for _, drop, _ in stale for key in drop
+    ]
+    raw_keys = list(dropped)
+    for key_batch in _batches(dropped, batch_size):
+        values = KVStoreModel.objects.filter(
+            key__in=key_batch
+        ).values_list('value', flat=True)
+        for value in values:
+            deserialize_image_file(value).delete()
+    for source_key, _, keep in stale:
+        if keep:
+            kvstore._set(source_key, keep, identity='thumbnails')
+        else:
+            raw_keys.append(add_prefix(source_key, 'thumbnails'))
+            raw_keys.append(add_prefix(source_key))
+    for key_batch in _batches(raw_keys, batch_size):
+        kvstore._delete_raw(*key_batch)
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:42
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.utils.timezone
+import posts.storage
+
+
+def fill_media_files(apps, schema_editor):
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    Post = apps.get_model('posts', 'Post')
+    refs = (
+        Post.objects.exclude(image='').order_by()
+        .values_list('image').annotate(refs=Count('pk'))
+    )
+    MediaFile.objects.bulk_create(
+        MediaFile(name=name, refs=count) for name, count in refs.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,102 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
+
+from . import shards
+from .images import EMPTY_METADATA, read_metadata
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
 
+FEED_FIELDS = (
+    'text',
+    'pub_date',
+    'image',
+    'image_width',
+    'image_height',
+    'author',
+    'group',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__title',
+    'group__slug',
+)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """Выборки постов и комментариев с учётом шардов (``posts.shards``).
+
+    Без шардов все методы возвращают выборку как есть.
+    """
+
+    def on_shard_of(self, post_id):
+        """Выборка в шарде, где лежит пост ``post_id``."""
+        if not shards.enabled():
+            return self
+        alias = shards.shard_for_post(post_id)
+        return self.none() if alias is None else self.using(alias)
+
+    def on_author_shard(self, author_id):
+        if not shards.enabled():
+            return self
+        return self.using(shards.shard_for_author(author_id))
+
+    def across_shards(self, aliases=None):
+        """Выборка по всем шардам (или по ``aliases``) одним потоком."""
+        if not shards.enabled():
+            return self
+        return shards.MergedQuerySet(
+            self.using(alias) for alias in aliases or settings.POST_SHARDS
+        )
+
+
+def related_users(*fields):
+    """Авторы строк шарда: один запрос к ``default`` вместо JOIN."""
+    return models.Prefetch(
+        'author', queryset=User.objects.only(*fields)
+    )
+
+
+class PostQuerySet(ShardedQuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним JOIN, только нужные поля.
+
+        В шардах авторов и группы нет, они подтягиваются из ``default``.
+        """
+        if shards.enabled():
+            return self.prefetch_related(
+                related_users('username', 'first_name', 'last_name'),
+                models.Prefetch(
+                    'group', queryset=Group.objects.only('title', 'slug')
+                ),
+            ).only(*(field for field in FEED_FIELDS if '__' not in field))
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+    def for_detail(self):
+        """Пост для своей страницы: автор, его счётчики и группа одним JOIN.
+
+        В шардах — отдельными запросами к ``default``.
+        """
+        if shards.enabled():
+            return self.prefetch_related('author__stats', 'group')
+        return self.select_related('author__stats', 'group')
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name="Текст поста",
     )
+    # автор и группа могут жить в другой базе, чем шард поста, поэтому
+    # связи проверяет Django, а не ограничения SQLite
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='posts',
         verbose_name='Автор',
+        db_constraint=False,
     )
     group = models.ForeignKey(
         'Group',
@@ -20,30 +104,94 @@ class Post(models.Model):
         null=True,
         on_delete=models.SET_NULL,
         verbose_name="Группа",
+        db_constraint=False,
     )
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # метаданные картинки заполняются при загрузке, чтобы шаблонам не
+    # приходилось открывать файл
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_size = models.PositiveIntegerField(null=True, blank=True)
+    image_format = models.CharField(max_length=10, blank=True)
+    image_hash = models.CharField(max_length=64, blank=True)
     pub_date = models.DateTimeField(auto_now_add=True)
+    # число комментариев, двигается сигналами вместо COUNT(*)
+    comment_count = models.PositiveIntegerField(default=0)
+    # меняется и при записи комментариев: по нему отвечают 304
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PostQuerySet.as_manager()
+
+    is_archived = False
 
     class Meta:
         ordering = ['-pub_date']
+        # под keyset-пагинацию лент: фильтр, затем (-pub_date, -id)
+        indexes = (
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if self.pk is None and shards.enabled():
+            self.pk = shards.next_post_id(self.author_id)
+            kwargs['force_insert'] = True
+        kwargs['using'] = shards.save_using(self, kwargs.get('using'))
+        if not self.image:
+            self.set_image_metadata(EMPTY_METADATA)
+        elif not self.image._committed:
+            self.set_image_metadata(read_metadata(self.image))
+        super().save(*args, **kwargs)
+
+    def set_image_metadata(self, metadata):
+        for field, value in metadata.items():
+            setattr(self, field, value)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    # меняется и при записи постов группы: по нему отвечают 304
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
 
 
+class CommentQuerySet(ShardedQuerySet):
+    def for_page(self):
+        """Комментарии для страницы поста: автор одним JOIN (или prefetch)."""
+        if shards.enabled():
+            return self.prefetch_related(related_users('username')).only(
+                'text', 'created', 'post', 'author'
+            )
+        return self.select_related('author').only(
+            'text', 'created', 'post', 'author', 'author__username'
+        )
+
+    def for_post(self, post_id):
+        return self.on_shard_of(post_id).filter(post_id=post_id)
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -53,7 +201,8 @@ class Comment(models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='comments'
+        related_name='comments',
+        db_constraint=False,
     )
     text = models.TextField(
         verbose_name='Комментарий',
@@ -64,8 +213,20 @@ class Comment(models.Model):
         auto_now_add=True,
     )
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created']
+        indexes = (
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx',
+            ),
+        )
+
+    def save(self, *args, **kwargs):
+        kwargs['using'] = shards.save_using(self, kwargs.get('using'))
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.text[:15]
@@ -90,3 +251,222 @@ class Follow(models.Model):
                 name='uniq_follow'
             ),
         )
+
+
+class TimelineQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Записи ленты вместе с постами, их авторами и группами."""
+        return self.select_related('post__author', 'post__group').only(
+            'pub_date',
+            'post',
+            *('post__' + field for field in FEED_FIELDS)
+        )
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: пост в ленте читателя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField()
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='uniq_timeline_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx',
+            ),
+        )
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора, обновляются сигналами."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    post_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # сколько из post_count лежит в архиве (posts.archive)
+    archived_post_count = models.PositiveIntegerField(default=0)
+    # последнее изменение постов или подписок автора
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_count}'
+
+
+class ThumbnailJob(models.Model):
+    """Задание фоновому воркеру: нарезать миниатюры картинки."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'В работе'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    image = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created']
+        indexes = (
+            models.Index(
+                fields=['status', 'created'],
+                name='thumbnailjob_queue_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.image}: {self.status}'
+
+
+class MediaFile(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    refs = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
+
+
+class PostSequence(models.Model):
+    """Общий для всех шардов счётчик id постов (``posts.shards``)."""
+
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.value)
+
+
+class ArchivedPost(models.Model):
+    """Старый пост, перенесённый из ``Post`` командой ``archive_posts``.
+
+    Колонки и id те же, что у поста, поэтому страница поста и профиль
+    читают архив теми же шаблонами. Архив только для чтения.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField()
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        db_constraint=False,
+    )
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        db_constraint=False,
+    )
+    image = models.ImageField(
+        upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        blank=True,
+    )
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_size = models.PositiveIntegerField(null=True, blank=True)
+    image_format = models.CharField(max_length=10, blank=True)
+    image_hash = models.CharField(max_length=64, blank=True)
+    pub_date = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    comment_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PostQuerySet.as_manager()
+
+    is_archived = True
+
+    class Meta:
+        ordering = ['-pub_date']
+        indexes = (
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='archivedpost_author_idx',
+            ),
+        )
+
+    def __str__(self):
+        return self.text[:15]
+
+    def save(self, *args, **kwargs):
+        kwargs['using'] = shards.save_using(self, kwargs.get('using'))
+        super().save(*args, **kwargs)
+
+
+class ArchivedComment(models.Model):
+    """Комментарий архивного поста."""
+
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments',
+        db_constraint=False,
+    )
+    text = models.TextField()
+    created = models.DateTimeField()
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created']
+        indexes = (
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='archivedcomment_post_idx',
+            ),
+        )
+
+    def __str__(self):
+        return self.text[:15]
+
+    def save(self, *args, **kwargs):
+        kwargs['using'] = shards.save_using(self, kwargs.get('using'))
+        super().save(*args, **kwargs)
@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_PARAM = 'cursor'
+PAGE_PARAM = 'page'
+CURSOR_SALT = 'posts.paginators.cursor'
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по полям ``ordering`` без OFFSET и COUNT(*).
+
+    Соседние страницы адресуются подписанными токенами, в которых лежат
+    значения ключей первой или последней записи текущей страницы. Токены
+    кладутся в атрибуты ``next_cursor``/``previous_cursor`` обычного
+    ``Page``; его методы ``has_next()``/``num_pages`` по-прежнему считают
+    COUNT(*), поэтому шаблоны опираются только на курсоры. ``position``
+    страницы — откуда она открыта (``first``, курсор или номер), по нему
+    различаются ключи кэша.
+
+    ``transform`` превращает строки выборки в объекты страницы, например
+    записи ленты подписок — в посты.
+    """
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-pub_date', '-pk'), transform=None):
+        super().__init__(object_list, per_page)
+        self.ordering = tuple(ordering)
+        self.transform = transform
+
+    def encode_cursor(self, obj, direction):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        return signing.dumps([direction, values], salt=CURSOR_SALT)
+
+    def decode_cursor(self, token):
+        try:
+            direction, values = signing.loads(token, salt=CURSOR_SALT)
+            if direction not in ('n', 'p') or (
+                len(values) != len(self.ordering)
+            ):
+                return None, None
+            values = [
+                parse_datetime(value) or value if isinstance(value, str)
+                else value
+                for value in values
+            ]
+        except (signing.BadSignature, TypeError, ValueError):
+            return None, None
+        return direction, values
+
+    def _seek(self, values, backward):
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != backward
+            step = Q(**{
+                '%s__%s' % (name, 'lt' if descending else 'gt'): values[i]
+            })
+            for prev_field, prev_value in zip(self.ordering[:i], values):
+                step &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition |= step
+        return condition
+
+    def _fetch(self, queryset):
+        rows = list(queryset[:self.per_page + 1])
+        return rows[:self.per_page], len(rows) > self.per_page
+
+    def _build_page(self, rows, number, position,
+                    next_row=None, previous_row=None):
+        next_cursor = (
+            self.encode_cursor(next_row, 'n') if next_row is not None
+            else None
+        )
+        previous_cursor = (
+            self.encode_cursor(previous_row, 'p')
+            if previous_row is not None else None
+        )
+        if self.transform is not None:
+            rows = self.transform(rows)
+        page = Page(rows, number, self)
+        page.position = position
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        return page
+
+    def get_cursor_page(self, cursor=None):
+        direction, values = self.decode_cursor(cursor) if cursor else (
+            None, None
+        )
+        if direction == 'p':
+            backward = [
+                field[1:] if field.startswith('-') else '-' + field
+                for field in self.ordering
+            ]
+            rows, has_more = self._fetch(
+                self.object_list.filter(self._seek(values, backward=True))
+                .order_by(*backward)
+            )
+            if has_more:
+                rows.reverse()
+                return self._build_page(
+                    rows, None, cursor,
+                    next_row=rows[-1], previous_row=rows[0],
+                )
+            # Дошли до начала ленты — отдаём каноничную первую страницу.
+            direction = None
+        queryset = self.object_list.order_by(*self.ordering)
+        if direction == 'n':
+            queryset = queryset.filter(self._seek(values, backward=False))
+        rows, has_more = self._fetch(queryset)
+        return self._build_page(
+            rows, 1 if direction is None else None,
+            cursor if direction else 'first',
+            next_row=rows[-1] if has_more else None,
+            previous_row=rows[0] if direction and rows else None,
+        )
+
+    def _numbered_rows(self, number):
+        offset = (number - 1) * self.per_page
+        return list(
+            self.object_list.order_by(*self.ordering)
+            [offset:offset + self.per_page + 1]
+        )
+
+    def get_numbered_page(self, number):
+        """Совместимость со ссылками вида ``?page=N``.
+
+        Номер за концом ленты, как и у ``Paginator.get_page``, даёт
+        последнюю страницу; COUNT(*) считается только в этом случае.
+        """
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        rows = self._numbered_rows(number)
+        if not rows and number > 1:
+            number = self.num_pages
+            rows = self._numbered_rows(number)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return self._build_page(
+            rows, number, 'first' if number == 1 else f'page:{number}',
+            next_row=rows[-1] if has_more else None,
+            previous_row=rows[0] if number > 1 and rows else None,
+        )
+
+
+def request_position(request):
+    """``position`` страницы, которую откроет ``paginate`` по этому запросу.
+
+    Известна до запроса к базе; курсор, который окажется негодным или
+    упрётся в начало ленты, даст страницу с другим ``position``.
+    """
+    cursor = request.GET.get(CURSOR_PARAM)
+    page_number = request.GET.get(PAGE_PARAM)
+    if page_number and not cursor:
+        try:
+            number = max(int(page_number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        return 'first' if number == 1 else f'page:{number}'
+    return cursor or 'first'
+
+
+def paginate(request, object_list, per_page=None, **kwargs):
+    """Возвращает страницу ленты по ``?cursor=`` или устаревшему ``?page=``."""
+    paginator = CursorPaginator(
+        object_list, per_page or settings.POST_COUNT, **kwargs
+    )
+    cursor = request.GET.get(CURSOR_PARAM)
+    page_number = request.GET.get(PAGE_PARAM)
+    if page_number and not cursor:
+        return paginator.get_numbered_page(page_number)
+    return paginator.get_cursor_page(cursor)
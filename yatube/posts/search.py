@@ -0,0 +1,110 @@
+"""Полнотекстовый поиск по постам на индексе SQLite FTS5.
+
+Индекс ``posts_post_fts`` — внешняя FTS5-таблица над ``posts_post``,
+которую синхронизируют триггеры, поэтому поиск видит и ``bulk_create``,
+и ``update()``. Django пересоздаёт таблицу ``posts_post`` в миграциях
+SQLite, теряя её триггеры, поэтому индекс и триггеры ставятся
+идемпотентно после каждого ``migrate``. На других СУБД поиск
+откатывается к ``icontains``.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    " text, content='posts_post', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai"
+    " AFTER INSERT ON posts_post BEGIN"
+    f" INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);"
+    " END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad"
+    " AFTER DELETE ON posts_post BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)"
+    " VALUES ('delete', old.id, old.text);"
+    " END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au"
+    " AFTER UPDATE OF text ON posts_post BEGIN"
+    f" INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)"
+    " VALUES ('delete', old.id, old.text);"
+    f" INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);"
+    " END",
+)
+
+
+def is_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection):
+    """Создаёт индекс и триггеры, если их нет; новый индекс наполняет."""
+    if not is_available(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        created = cursor.fetchone() is None
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        if created:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+
+
+def install_after_migrate(sender, using, **kwargs):
+    from django.db import connections
+
+    install(connections[using])
+
+
+def match_query(text):
+    """Пользовательский ввод -> безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки (операторы FTS5 не срабатывают),
+    последнее ищется по префиксу, чтобы работал поиск «на лету».
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = ['"%s"' % word for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids(text):
+    """Подзапрос id постов, подходящих под запрос."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match_query(text),),
+    )
+
+
+def search_posts(text, queryset=None):
+    """Посты по запросу и порядок для курсорной пагинации.
+
+    На FTS5 выдача упорядочена по релевантности (bm25, меньше — лучше).
+    """
+    queryset = Post.objects.for_feed() if queryset is None else queryset
+    query = match_query(text)
+    if query is None:
+        return queryset.none(), ('-pub_date', '-pk')
+    if not is_available():
+        return queryset.filter(text__icontains=text), ('-pub_date', '-pk')
+    queryset = queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = posts_post.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[query],
+    ).annotate(rank=RawSQL(f'{FTS_TABLE}.rank', ()))
+    return queryset, ('rank', 'pk')
@@ -0,0 +1,222 @@
+"""Шардирование постов и комментариев по автору (включается по желанию).
+
+Если задан ``settings.POST_SHARDS`` (псевдонимы баз, по умолчанию пусто),
+посты автора лежат в базе ``POST_SHARDS[author_id % len(POST_SHARDS)]``,
+а комментарии — рядом со своим постом, так что запись поста или
+комментария берёт блокировку писателя только своего шарда. Пользователи,
+группы, подписки и счётчики остаются в ``default``; авторы и группы к
+постам шарда подтягиваются ``prefetch_related``, а не JOIN.
+
+Id поста выдаёт общий счётчик ``PostSequence`` в ``default``: ``id =
+n * SHARD_SLOTS + номер шарда``, поэтому по id из URL сразу видно, где
+лежит пост. Выборки по нескольким шардам (``across_shards()``) отдают
+``MergedQuerySet``: каждый шард читается со своим ORDER BY и LIMIT, а
+строки сливаются ``heapq.merge`` — курсорная пагинация работает поверх
+него без изменений.
+"""
+import heapq
+from itertools import chain, islice
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, prefetch_related_objects
+
+# шардов может быть не больше, чем остатков в id поста
+SHARD_SLOTS = 16
+# архивные копии лежат в том же шарде, что и горячие строки
+POST_MODELS = ('posts.Post', 'posts.ArchivedPost')
+SHARDED_MODELS = POST_MODELS + ('posts.Comment', 'posts.ArchivedComment')
+# таблицы в шарде: posts и те, на которые ссылаются их внешние ключи, —
+# пустые, но без них SQLite не удалит пост каскадом
+SHARD_APPS = ('posts', 'auth', 'contenttypes')
+
+
+def enabled():
+    return bool(settings.POST_SHARDS)
+
+
+def is_sharded(model):
+    """Модель (или её экземпляр) лежит в шардах."""
+    return enabled() and model._meta.label in SHARDED_MODELS
+
+
+def databases():
+    """Базы, которые бывают шардами: из настроек и тестовые."""
+    return {*settings.POST_SHARDS, *settings.TEST_POST_SHARDS}
+
+
+def shard_for_author(author_id):
+    return settings.POST_SHARDS[author_id % len(settings.POST_SHARDS)]
+
+
+def shard_for_post(post_id):
+    """Шард поста по его id или ``None``, если такого шарда нет."""
+    index = int(post_id) % SHARD_SLOTS
+    if index < len(settings.POST_SHARDS):
+        return settings.POST_SHARDS[index]
+    return None
+
+
+def aliases(model):
+    """Базы, в которых лежат строки модели; ``None`` — обычный роутинг."""
+    return list(settings.POST_SHARDS) if is_sharded(model) else [None]
+
+
+def next_post_id(author_id):
+    """Новый id поста автора из общего счётчика в ``default``."""
+    PostSequence = apps.get_model('posts', 'PostSequence')
+    rows = PostSequence.objects.using('default')
+    with transaction.atomic(using='default'):
+        if not rows.filter(pk=1).update(value=F('value') + 1):
+            try:
+                with transaction.atomic(using='default'):
+                    rows.create(pk=1, value=1)
+            except IntegrityError:
+                # счётчик только что создал другой процесс
+                rows.filter(pk=1).update(value=F('value') + 1)
+        value = rows.values_list('value', flat=True).get(pk=1)
+    index = settings.POST_SHARDS.index(shard_for_author(author_id))
+    return value * SHARD_SLOTS + index
+
+
+def save_using(instance, using=None):
+    """База для ``save()``: шард строки, даже если ``create()`` передал
+    ``default``, выбранный без подсказки об экземпляре."""
+    if not is_sharded(instance) or using in settings.POST_SHARDS:
+        return using
+    return ShardRouter()._shard(instance)
+
+
+class ShardRouter:
+    """Пишет и читает посты и комментарии в шарде, остальное — в default.
+
+    Выборки без экземпляра в подсказках роутер не угадывает: для них
+    есть ``on_shard_of()``, ``on_author_shard()`` и ``across_shards()``.
+    """
+
+    def _shard(self, instance):
+        # в подсказке бывает и связанный объект: пост для комментария
+        if instance._state.db in settings.POST_SHARDS:
+            return instance._state.db
+        if instance._meta.label in POST_MODELS:
+            if instance.pk is not None:
+                return shard_for_post(instance.pk)
+            return shard_for_author(instance.author_id)
+        return shard_for_post(instance.post_id)
+
+    def _route(self, model, hints):
+        if not enabled():
+            return None
+        instance = hints.get('instance')
+        if is_sharded(model):
+            if instance is not None and is_sharded(instance):
+                return self._shard(instance)
+            return None
+        if instance is not None and (
+            instance._state.db in settings.POST_SHARDS
+        ):
+            # автор, группа и счётчики поста из шарда живут в default
+            return 'default'
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} & databases():
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in databases():
+            return app_label in SHARD_APPS
+        return None
+
+
+class MergedQuerySet:
+    """Одна выборка по нескольким шардам.
+
+    Цепочки вроде ``filter()``/``only()`` применяются к выборке каждого
+    шарда. Срез ``[start:stop]`` читает из каждого шарда не больше
+    ``stop`` строк и сливает их по ``order_by``; ``prefetch_related``
+    выполняется один раз для уже слитой страницы.
+    """
+
+    CHAINABLE = (
+        'filter', 'exclude', 'only', 'defer', 'extra', 'annotate', 'none',
+        'values', 'values_list', 'distinct',
+    )
+
+    def __init__(self, querysets, ordering=(), prefetch=()):
+        self.querysets = []
+        prefetch = list(prefetch)
+        for queryset in querysets:
+            prefetch += [
+                lookup for lookup in queryset._prefetch_related_lookups
+                if lookup not in prefetch
+            ]
+            self.querysets.append(queryset.prefetch_related(None))
+        self.ordering = tuple(ordering)
+        self.prefetch = prefetch
+
+    def _chain(self, method, *args, **kwargs):
+        return MergedQuerySet(
+            (getattr(qs, method)(*args, **kwargs) for qs in self.querysets),
+            self.ordering,
+            self.prefetch,
+        )
+
+    def __getattr__(self, name):
+        if name not in self.CHAINABLE:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._chain(name, *args, **kwargs)
+
+    def order_by(self, *ordering):
+        merged = self._chain('order_by', *ordering)
+        merged.ordering = ordering
+        return merged
+
+    def prefetch_related(self, *lookups):
+        return MergedQuerySet(
+            self.querysets, self.ordering, self.prefetch + list(lookups)
+        )
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def _key(self, row):
+        return tuple(
+            getattr(row, field.lstrip('-')) for field in self.ordering
+        )
+
+    def _merge(self, iterables):
+        if not self.ordering:
+            return chain(*iterables)
+        descending = {field.startswith('-') for field in self.ordering}
+        if len(descending) > 1:
+            raise ValueError('Слияние шардов требует одного направления')
+        return heapq.merge(
+            *iterables, key=self._key, reverse=descending.pop()
+        )
+
+    def _prefetch(self, rows):
+        if self.prefetch:
+            prefetch_related_objects(rows, *self.prefetch)
+        return rows
+
+    def __iter__(self):
+        return iter(self._prefetch(list(self._merge(self.querysets))))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.stop is None:
+            raise TypeError('Выборку по шардам можно только срезать')
+        start = item.start or 0
+        rows = self._merge(qs[:item.stop] for qs in self.querysets)
+        return self._prefetch(list(islice(rows, start, item.stop)))
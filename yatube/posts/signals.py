@@ -0,0 +1,171 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.cache import bump_tags
+
+from . import archive, media, shards, stats, timeline
+from .cache import INDEX_TAG, author_tag, group_tag, post_tag, post_tags
+from .models import ArchivedPost, Comment, Follow, Group, Post, User
+
+
+def touch_groups(*group_ids):
+    group_ids = [group_id for group_id in group_ids if group_id]
+    if group_ids:
+        Group.objects.filter(pk__in=group_ids).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver(pre_save, sender=Post)
+def post_remember_previous(sender, instance, raw=False, **kwargs):
+    # при смене группы пост должен пропасть и из ленты старой группы,
+    # при смене картинки — отпустить ссылку на старый файл
+    instance._previous_group_id = None
+    instance._previous_image = ''
+    if not instance._state.adding and not raw:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.on_shard_of(instance.pk).filter(pk=instance.pk)
+            .values_list('group_id', 'image').first()
+        ) or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    bump_tags(*post_tags(
+        instance, getattr(instance, '_previous_group_id', None)
+    ))
+    if raw:
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    touch_groups(instance.group_id, previous_group_id)
+    if created:
+        if not shards.enabled():
+            timeline.fan_out(instance)
+        stats.bump(instance.author_id, 'post_count', 1)
+    else:
+        stats.touch(instance.author_id)
+    previous_image = getattr(instance, '_previous_image', '')
+    if instance.image.name != previous_image:
+        media.retain(instance.image.name)
+        media.release(previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if archive.in_progress():
+        # пост переехал в архив: счётчики и ссылки на картинку те же
+        return
+    bump_tags(*post_tags(instance))
+    touch_groups(instance.group_id)
+    stats.bump(instance.author_id, 'post_count', -1)
+    media.release(instance.image.name)
+
+
+# поля пользователя, которые видны в карточках постов и профиле
+USER_DISPLAY_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def author_group_ids(author_id):
+    return set(
+        Post.objects.on_author_shard(author_id).filter(author_id=author_id)
+        .exclude(group=None).order_by()
+        .values_list('group_id', flat=True).distinct()
+    )
+
+
+def group_author_ids(group_id):
+    author_ids = set()
+    for alias in shards.aliases(Post):
+        author_ids.update(
+            Post.objects.using(alias).filter(group_id=group_id).order_by()
+            .values_list('author_id', flat=True).distinct()
+        )
+    return author_ids
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, raw=False, **kwargs):
+    # название и slug группы видны на её странице, страницах её постов и
+    # в карточках лент: главной и профилей её авторов
+    bump_tags(
+        group_tag(instance.pk),
+        INDEX_TAG,
+        *(author_tag(author_id) for author_id in group_author_ids(
+            instance.pk
+        )),
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if created or raw or (
+        update_fields is not None
+        and not USER_DISPLAY_FIELDS & set(update_fields)
+    ):
+        # вход двигает только last_login — ленты от него не зависят
+        return
+    group_ids = author_group_ids(instance.pk)
+    bump_tags(
+        author_tag(instance.pk),
+        INDEX_TAG,
+        *(group_tag(group_id) for group_id in group_ids),
+    )
+    # ETag страниц профиля, групп и постов автора считаются от updated_at
+    stats.touch(instance.pk)
+    touch_groups(*group_ids)
+    for model in (Post, ArchivedPost):
+        model.objects.on_author_shard(instance.pk).filter(
+            author_id=instance.pk
+        ).update(updated_at=timezone.now())
+
+
+def bump_comment_count(post_id, delta):
+    """Двигает счётчик комментариев поста и отмечает, что пост изменился."""
+    post = Post.objects.on_shard_of(post_id).filter(pk=post_id)
+    rows = post
+    changes = {'updated_at': timezone.now()}
+    if delta:
+        changes['comment_count'] = F('comment_count') + delta
+        if delta < 0:
+            rows = rows.filter(comment_count__gte=-delta)
+    if not rows.update(**changes):
+        post.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    bump_tags(post_tag(instance.post_id))
+    if raw:
+        return
+    bump_comment_count(instance.post_id, 1 if created else 0)
+    if created:
+        stats.bump(instance.author_id, 'comment_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if archive.in_progress():
+        return
+    bump_tags(post_tag(instance.post_id))
+    bump_comment_count(instance.post_id, -1)
+    stats.bump(instance.author_id, 'comment_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        if not shards.enabled():
+            timeline.backfill(instance.user_id, instance.author_id)
+        stats.bump(instance.author_id, 'follower_count', 1)
+        stats.bump(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    if not shards.enabled():
+        timeline.prune(instance.user_id, instance.author_id)
+    stats.bump(instance.author_id, 'follower_count', -1)
+    stats.bump(instance.user_id, 'following_count', -1)
@@ -0,0 +1,87 @@
+"""Счётчики автора в ``AuthorStats``.
+
+Сигналы двигают счётчики атомарным ``UPDATE ... SET n = n + 1``, так что
+страницы профиля и поста читают их одной строкой вместо COUNT(*).
+Если строки ещё нет, она создаётся с честным пересчётом; команда
+``reconcile_author_stats`` исправляет накопившийся дрейф.
+"""
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import shards
+from .models import (
+    ArchivedComment, ArchivedPost, AuthorStats, Comment, Follow, Post,
+)
+
+# счётчик: модели, которые он считает, и колонка пользователя; архивные
+# посты и комментарии по-прежнему считаются за автором
+COUNTERS = {
+    'post_count': ((Post, ArchivedPost), 'author_id'),
+    'archived_post_count': ((ArchivedPost,), 'author_id'),
+    'comment_count': ((Comment, ArchivedComment), 'author_id'),
+    'follower_count': ((Follow,), 'author_id'),
+    'following_count': ((Follow,), 'user_id'),
+}
+
+
+def count_many(user_ids):
+    """Честно пересчитывает счётчики для пачки пользователей."""
+    counts = {
+        user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids
+    }
+    for field, (models, column) in COUNTERS.items():
+        # посты и комментарии автора могут лежать в нескольких шардах
+        sources = [
+            (model, alias) for model in models
+            for alias in shards.aliases(model)
+        ]
+        for model, alias in sources:
+            rows = (
+                model.objects.using(alias)
+                .filter(**{f'{column}__in': user_ids})
+                .order_by()
+                .values_list(column)
+                .annotate(total=Count('pk'))
+            )
+            for user_id, total in rows:
+                counts[user_id][field] += total
+    return counts
+
+
+def recount(user_id):
+    counters = count_many([user_id])[user_id]
+    stats, _ = AuthorStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={**counters, 'updated_at': timezone.now()},
+    )
+    return stats
+
+
+def bump(user_id, field, delta):
+    rows = AuthorStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        # не уходим ниже нуля, даже если счётчик уже разошёлся с данными
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    updated = rows.update(
+        **{field: F(field) + delta}, updated_at=timezone.now()
+    )
+    if not updated:
+        if delta > 0:
+            recount(user_id)
+        else:
+            touch(user_id)
+
+
+def touch(user_id):
+    """Отмечает, что страницы автора изменились (для ответов 304)."""
+    AuthorStats.objects.filter(user_id=user_id).update(
+        updated_at=timezone.now()
+    )
+
+
+def for_user(user):
+    """Счётчики пользователя; отсутствующая строка создаётся пересчётом."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return recount(user.pk)
@@ -0,0 +1,56 @@
+from django import template
+
+from posts import thumbnails
+from posts.images import original
+
+register = template.Library()
+
+# ширина картинки в вёрстке: на телефонах во весь экран, иначе не шире 960
+SIZES = '(max-width: 576px) 100vw, 960px'
+
+
+def _srcset(sizes):
+    return ', '.join(f'{thumbnail.url} {width}w' for width, thumbnail in sizes)
+
+
+def picture(post, ready):
+    """Контекст ``<picture>``: готовые варианты или, пока их нет, оригинал."""
+    if not post.image:
+        return None
+    by_format = ready.get(post.image.name, {})
+    fallback = by_format.get(thumbnails.FALLBACK_FORMAT)
+    if not fallback:
+        return {'img': original(post)}
+    return {
+        'img': fallback[-1][1],
+        'srcset': _srcset(fallback),
+        'sizes': SIZES,
+        'sources': [
+            {
+                'type': thumbnails.MIME_TYPES[image_format],
+                'srcset': _srcset(sizes),
+            }
+            for image_format, sizes in by_format.items()
+            if image_format != thumbnails.FALLBACK_FORMAT
+        ],
+    }
+
+
+@register.simple_tag
+def prefetch_feed_images(posts):
+    """Находит варианты картинок всей страницы ленты одним запросом."""
+    posts = list(posts)
+    ready = thumbnails.ready_variants(post.image for post in posts)
+    for post in posts:
+        post.feed_picture = picture(post, ready)
+    return ''
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def feed_picture(post):
+    """Картинка поста в ленте: все готовые ширины и форматы."""
+    if not hasattr(post, 'feed_picture'):
+        post.feed_picture = picture(
+            post, thumbnails.ready_variants([post.image])
+        )
+    return {'picture': post.feed_picture}
@@ -0,0 +1,203 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import archive, media, stats
+from posts.models import (
+    ArchivedComment, ArchivedPost, Comment, Group, MediaFile, Post,
+)
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_COUNT=2)
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='archive', description='Описание'
+        )
+        cls.old_posts = [
+            Post.objects.create(
+                author=cls.user,
+                group=cls.group,
+                text=f'Старый пост {i}',
+                image=SimpleUploadedFile('old.gif', SMALL_GIF, 'image/gif'),
+            )
+            for i in range(3)
+        ]
+        Comment.objects.create(
+            post=cls.old_posts[0], author=cls.user, text='Старый коммент'
+        )
+        Post.objects.filter(pk__in=[p.pk for p in cls.old_posts]).update(
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        cls.new_post = Post.objects.create(author=cls.user, text='Новый пост')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_posts', '--older-than=365', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_moves_nothing(self):
+        self.assertIn('3', self.archive('--dry-run'))
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertFalse(ArchivedPost.objects.exists())
+
+    def test_move_keeps_counters_and_media(self):
+        image = self.old_posts[0].image.name
+        refs = MediaFile.objects.get(name=image).refs
+        self.archive('--batch-size=2')
+        self.assertEqual(
+            list(Post.objects.values_list('pk', flat=True)),
+            [self.new_post.pk],
+        )
+        self.assertEqual(ArchivedPost.objects.count(), 3)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(ArchivedComment.objects.count(), 1)
+        counters = stats.for_user(User.objects.get(pk=self.user.pk))
+        self.assertEqual(counters.post_count, 4)
+        self.assertEqual(counters.comment_count, 1)
+        self.assertEqual(counters.archived_post_count, 3)
+        self.assertEqual(
+            counters.post_count, stats.recount(self.user.pk).post_count
+        )
+        self.assertEqual(MediaFile.objects.get(name=image).refs, refs)
+        self.assertEqual(media.recount(image).refs, refs)
+
+    def test_move_rereads_batch_under_lock(self):
+        """Правка и новый комментарий после выборки пачки не теряются."""
+        batch = list(archive.candidates(timezone.now())[:2])
+        Post.objects.filter(pk=batch[0].pk).update(text='Правка')
+        Post.objects.filter(pk=batch[1].pk).delete()
+        Comment.objects.create(
+            post=batch[0], author=self.user, text='Поздний коммент'
+        )
+        self.assertEqual(archive.move(batch), (1, 2))
+        self.assertEqual(
+            ArchivedPost.objects.get(pk=batch[0].pk).text, 'Правка'
+        )
+        self.assertFalse(ArchivedPost.objects.filter(pk=batch[1].pk).exists())
+        self.assertEqual(
+            ArchivedComment.objects.filter(post_id=batch[0].pk).count(), 2
+        )
+
+    @mock.patch(
+        'posts.management.commands.archive_posts.LOCK_RETRY_DELAY', 0
+    )
+    def test_locked_batch_is_retried_then_left(self):
+        locked = OperationalError('database is locked')
+        err = StringIO()
+        with mock.patch.object(archive, 'move', side_effect=locked) as move:
+            out = StringIO()
+            call_command(
+                'archive_posts', '--older-than=365', stdout=out, stderr=err,
+            )
+        self.assertEqual(move.call_count, 3)
+        self.assertIn('database is locked (3/3)', err.getvalue())
+        self.assertIn('Перенесено постов: 0', out.getvalue())
+        move_batch = archive.move
+        attempts = []
+
+        def locked_once(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise locked
+            return move_batch(*args)
+
+        with mock.patch.object(archive, 'move', side_effect=locked_once):
+            self.assertIn('Перенесено постов: 3', self.archive())
+        self.assertEqual(len(attempts), 2)
+
+    def test_group_page_changes_after_move(self):
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        response = self.client.get(url)
+        self.archive()
+        refreshed = self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertEqual(len(refreshed.context['page_obj']), 0)
+
+    def test_post_detail_reads_archive(self):
+        self.archive()
+        self.client.force_login(self.user)
+        post = self.old_posts[0]
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['post'].is_archived)
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Старый коммент'],
+        )
+        self.assertNotContains(
+            response, reverse('posts:add_comment', args=(post.pk,))
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:comment_list', args=(post.pk,))
+            ).status_code,
+            200,
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:post_edit', args=(post.pk,))
+            ).status_code,
+            404,
+        )
+
+    def test_profile_continues_with_archive(self):
+        self.archive()
+        url = reverse('posts:profile', args=(self.user.username,))
+        texts = []
+        cursor = None
+        while True:
+            response = self.client.get(url, {'cursor': cursor or ''})
+            page = response.context['page_obj']
+            texts += [post.text for post in page]
+            cursor = page.next_cursor
+            if not cursor:
+                break
+        self.assertEqual(
+            texts,
+            ['Новый пост'] + [f'Старый пост {i}' for i in (2, 1, 0)],
+        )
+        index = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            [post.text for post in index.context['page_obj']], ['Новый пост']
+        )
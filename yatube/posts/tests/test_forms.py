@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -68,6 +69,12 @@ class TestCreateForm(TestCase):
         self.user = TestCreateForm.user
         self.authorized_client.force_login(self.user)
 
+    @staticmethod
+    def stored_name(upload):
+        upload.seek(0)
+        digest = hashlib.sha256(upload.read()).hexdigest()
+        return f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+
     def test_form_create(self):
         """Проверка формы создания нового поста"""
         post_count = Post.objects.count()
@@ -85,7 +92,7 @@ class TestCreateForm(TestCase):
         self.assertTrue(Post.objects.filter(
             text='Текст',
             group=TestCreateForm.group,
-            image='posts/small0.gif',
+            image=self.stored_name(self.uploaded0),
         ).exists())
 
     def test_guest_new_post(self):
@@ -119,5 +126,5 @@ class TestCreateForm(TestCase):
         self.assertTrue(Post.objects.filter(
             text='Текст1',
             group=TestCreateForm.group,
-            image='posts/small1.gif',
+            image=self.stored_name(self.uploaded1),
         ).exists())
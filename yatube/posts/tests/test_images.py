@@ -0,0 +1,137 @@
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.forms import PostForm
+from posts.models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+
+def make_image(name='photo.png', size=(40, 30), image_format='PNG',
+               **options):
+    buffer = BytesIO()
+    Image.new('RGB', size, (10, 200, 10)).save(
+        buffer, image_format, **options
+    )
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PREGENERATE=True)
+class ImageMetadataTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='meta')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_metadata_filled_on_upload(self):
+        """При загрузке картинки сохраняются размеры, формат и хэш."""
+        upload = make_image(size=(64, 48))
+        content = upload.read()
+        post = Post.objects.create(author=self.user, text='т', image=upload)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (64, 48))
+        self.assertEqual(post.image_format, 'PNG')
+        self.assertEqual(post.image_size, len(content))
+        self.assertEqual(
+            post.image_hash, hashlib.sha256(content).hexdigest()
+        )
+
+    def test_metadata_cleared_with_image(self):
+        post = Post.objects.create(
+            author=self.user, text='т', image=make_image()
+        )
+        post.image = None
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_hash, '')
+
+    def test_feed_renders_size_without_opening_file(self):
+        """Лента берёт размеры из модели, даже если файла уже нет."""
+        Post.objects.create(
+            author=self.user, text='т', image='posts/missing.png',
+            image_width=320, image_height=200,
+        )
+        response = Client().get(reverse('posts:index'))
+        self.assertContains(response, 'width="320" height="200"')
+
+    def test_backfill_command(self):
+        post = Post.objects.create(
+            author=self.user, text='т', image=make_image(size=(12, 34))
+        )
+        Post.objects.create(
+            author=self.user, text='т', image='posts/missing.png'
+        )
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None, image_hash=''
+        )
+        out = StringIO()
+        call_command('backfill_image_metadata', stdout=out)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (12, 34))
+        self.assertNotEqual(post.image_hash, '')
+        self.assertIn('Заполнено: 1, недоступно: 1', out.getvalue())
+
+
+@override_settings(IMAGE_MAX_SIDE=100)
+class IngestTest(TestCase):
+    def clean(self, upload):
+        form = PostForm(data={'text': 'т'}, files={'image': upload})
+        form.is_valid()
+        return form
+
+    def test_small_clean_upload_kept_as_is(self):
+        upload = make_image('small.png')
+        content = upload.read()
+        upload.seek(0)
+        form = self.clean(upload)
+        image = form.cleaned_data['image']
+        self.assertEqual(image.name, 'small.png')
+        self.assertEqual(image.read(), content)
+        self.assertIn('open', form.ingest_timings)
+
+    def test_photo_rotated_downscaled_and_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # повернуть на 90° по часовой
+        exif[0x010F] = 'Camera'
+        form = self.clean(make_image(
+            'photo.jpeg', (400, 200), 'JPEG', exif=exif.tobytes()
+        ))
+        image = form.cleaned_data['image']
+        self.assertEqual(image.name, 'photo.jpg')
+        with Image.open(image) as stored:
+            self.assertEqual(stored.size, (50, 100))
+            self.assertEqual(len(stored.getexif()), 0)
+            self.assertNotIn('exif', stored.info)
+        self.assertEqual(
+            list(form.ingest_timings),
+            ['open', 'decode', 'orient', 'resize', 'encode'],
+        )
+
+    def test_decompression_bomb_rejected_before_decode(self):
+        with self.settings(IMAGE_MAX_PIXELS=1000):
+            form = self.clean(make_image(size=(100, 100)))
+        self.assertEqual(
+            form.errors['image'], ['Картинка слишком большая.']
+        )
@@ -1,7 +1,13 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from core.cache import tag_versions
+
+from ..cache import author_tag
+from ..models import AuthorStats, Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -29,3 +35,48 @@ class PostModelTest(TestCase):
         post = PostModelTest.post
         expected_object_name = post.text[:15]
         self.assertEqual(expected_object_name, str(post))
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении записей."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).post_count, 1)
+        self.assertEqual(self.stats(self.author).follower_count, 1)
+        self.assertEqual(self.stats(self.reader).comment_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).post_count, 0)
+        self.assertEqual(self.stats(self.author).follower_count, 0)
+        self.assertEqual(self.stats(self.reader).comment_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_reconcile_fixes_drift(self):
+        """reconcile_author_stats возвращает счётчики к фактическим."""
+        Post.objects.create(author=self.author, text='Тестовый пост')
+        AuthorStats.objects.filter(user=self.author).update(post_count=42)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        drifted = self.stats(self.author).updated_at
+        version = tag_versions([author_tag(self.author.pk)])
+        call_command('reconcile_author_stats', stdout=StringIO())
+        self.assertEqual(self.stats(self.author).post_count, 1)
+        self.assertGreater(self.stats(self.author).updated_at, drifted)
+        self.assertNotEqual(
+            tag_versions([author_tag(self.author.pk)]), version
+        )
+        self.assertEqual(self.stats(self.reader).post_count, 0)
@@ -0,0 +1,131 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.cache import LOCK_PREFIX
+from core.page_cache import _key
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='cached', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:group_list', kwargs={'slug': 'cached'}),
+            'profile': reverse(
+                'posts:profile', kwargs={'username': 'author'}
+            ),
+            'post': reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}
+            ),
+            'about': reverse('about:author'),
+        }
+
+    def assert_cached(self, url):
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context)
+        return response
+
+    def test_anonymous_pages_served_from_cache(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                first = self.client.get(url)
+                self.assertEqual(
+                    self.assert_cached(url).content, first.content
+                )
+
+    def test_headers_for_downstream_cache(self):
+        response = self.client.get(self.urls['post'])
+        self.assertEqual(
+            response['Surrogate-Key'],
+            f'post:{self.post.pk} author:{self.author.pk} '
+            f'group:{self.group.pk}',
+        )
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=60', response['Cache-Control'])
+        cached = self.client.get(
+            self.urls['post'], HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    def rename_author(self):
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Автор'
+        author.save()
+
+    def test_writes_purge_only_dependent_pages(self):
+        writes = (
+            ('comment', lambda: self.post.comments.create(
+                author=self.author, text='Комментарий'
+            ), {'post'}),
+            ('group', lambda: Group.objects.filter(pk=self.group.pk).get()
+             .save(), {'index', 'group', 'profile', 'post'}),
+            ('author', self.rename_author,
+             {'index', 'group', 'profile', 'post'}),
+            ('post', lambda: Post.objects.create(
+                author=self.author, text='Новый', group=self.group
+            ), {'index', 'group', 'profile', 'post'}),
+        )
+        for name, write, purged in writes:
+            with self.subTest(write=name):
+                for url in self.urls.values():
+                    self.client.get(url)
+                write()
+                for page, url in self.urls.items():
+                    response = self.client.get(url)
+                    self.assertEqual(
+                        response.context is not None, page in purged, page
+                    )
+
+    def test_stale_page_served_while_another_request_renders(self):
+        response = self.client.get(self.urls['index'])
+        Post.objects.create(author=self.author, text='Свежий пост')
+        key = _key(response.wsgi_request)
+        cache.add(LOCK_PREFIX + key, 1)
+        stale = self.assert_cached(self.urls['index'])
+        self.assertNotContains(stale, 'Свежий пост')
+        cache.delete(LOCK_PREFIX + key)
+        self.assertContains(self.client.get(self.urls['index']), 'Свежий пост')
+
+    def test_uncacheable_pages_do_not_wait_for_lock(self):
+        url = reverse('users:login')
+        response = self.client.get(url)
+        key = _key(response.wsgi_request)
+        cache.add(LOCK_PREFIX + key, 1)
+        with override_settings(CACHE_WAIT_TIMEOUT=30):
+            started = time.monotonic()
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_logged_in_users_bypass_cache(self):
+        client = Client()
+        client.force_login(self.author)
+        client.get(self.urls['index'])
+        response = client.get(self.urls['index'])
+        self.assertIsNotNone(response.context)
+        self.assertNotIn('Surrogate-Key', response)
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(self.urls['index'])
+        self.assertIsNotNone(self.client.get(self.urls['index']).context)
@@ -0,0 +1,88 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post
+
+User = get_user_model()
+
+# ``SCAN t`` без ``USING INDEX`` — полный проход по таблице
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+@override_settings(POST_COUNT=5, COMMENT_COUNT=5)
+class QueryPlanTest(TestCase):
+    """Запросы лент идут по индексам: без полного скана и сортировки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='plans', description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(12):
+            cls.post = Post.objects.create(
+                author=cls.author, text=f'Пост {i}', group=cls.group
+            )
+            cls.post.comments.create(author=cls.reader, text='Комментарий')
+        for i in range(12):
+            cls.post.comments.create(author=cls.reader, text='Комментарий')
+
+    def query_plans(self, client, url, data=None):
+        """``(sql, шаги плана)`` всех SELECT, которые выполнила страница."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append(
+                    (query['sql'], [row[-1] for row in cursor.fetchall()])
+                )
+        return response, plans
+
+    def assert_indexed(self, client, url, page_key):
+        """Проверяет первую страницу и следующую по курсору."""
+        data = None
+        for page in ('first', 'next'):
+            response, plans = self.query_plans(client, url, data)
+            for sql, plan in plans:
+                for step in plan:
+                    with self.subTest(url=url, page=page, step=step):
+                        self.assertNotIn(TEMP_SORT, step, sql)
+                        self.assertNotRegex(step, FULL_SCAN, sql)
+            cursor = response.context[page_key].next_cursor
+            self.assertIsNotNone(cursor)
+            data = {'cursor': cursor}
+
+    def test_feeds_use_indexes(self):
+        reader = Client()
+        reader.force_login(self.reader)
+        pages = (
+            (self.client, reverse('posts:index'), 'page_obj'),
+            (self.client, reverse(
+                'posts:group_list', kwargs={'slug': 'plans'}
+            ), 'page_obj'),
+            (self.client, reverse(
+                'posts:profile', kwargs={'username': 'author'}
+            ), 'page_obj'),
+            (reader, reverse('posts:follow_index'), 'page_obj'),
+            (self.client, reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}
+            ), 'comments'),
+        )
+        for client, url, page_key in pages:
+            self.assert_indexed(client, url, page_key)
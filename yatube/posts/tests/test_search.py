@@ -0,0 +1,74 @@
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='axx')
+        cls.once = Post.objects.create(
+            author=cls.user, text='Кошка спит на диване'
+        )
+        cls.twice = Post.objects.create(
+            author=cls.user, text='Кошка ловит кошку, кошка довольна'
+        )
+        cls.other = Post.objects.create(
+            author=cls.user, text='Собака гуляет во дворе'
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def test_search_ranks_results(self):
+        """Более релевантный пост выше, нерелевантных нет."""
+        page = self.search('кошка')
+        self.assertEqual(
+            [post.pk for post in page], [self.twice.pk, self.once.pk]
+        )
+
+    def test_search_by_prefix_and_case(self):
+        self.assertEqual(
+            [post.pk for post in self.search('СОБА')], [self.other.pk]
+        )
+
+    def test_index_follows_writes(self):
+        """Триггеры держат индекс в синхронизации даже для update()."""
+        Post.objects.filter(pk=self.other.pk).update(text='Попугай')
+        self.assertEqual(len(self.search('собака')), 0)
+        self.assertEqual(len(self.search('попугай')), 1)
+        Post.objects.get(pk=self.other.pk).delete()
+        self.assertEqual(len(self.search('попугай')), 0)
+
+    def test_search_paginates_with_cursor(self):
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Кошка номер {i}')
+            for i in range(12)
+        )
+        first = self.search('кошка')
+        second = self.search('кошка', cursor=first.next_cursor)
+        seen = {post.pk for post in first} | {post.pk for post in second}
+        self.assertEqual(len(seen), 14)
+        self.assertIsNone(second.next_cursor)
+
+    def test_operators_in_query_are_literal(self):
+        self.assertEqual(len(self.search('"кошка* ^(')), 2)
+        self.assertEqual(len(self.search('!!!')), 0)
+
+    def test_admin_uses_index(self):
+        admin = site._registry[Post]
+        request = RequestFactory().get('/admin/posts/post/')
+        queryset, use_distinct = admin.get_search_results(
+            request, Post.objects.all(), 'двор'
+        )
+        self.assertEqual(list(queryset), [self.other])
+        self.assertFalse(use_distinct)
@@ -0,0 +1,171 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import shards, stats
+from posts.models import Comment, Follow, Post
+from posts.paginators import CursorPaginator
+
+User = get_user_model()
+
+
+class MergedQuerySetTest(TestCase):
+    """Слияние выборок по дате совпадает с одной выборкой по всем."""
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.first = User.objects.create_user(username='first')
+        cls.second = User.objects.create_user(username='second')
+        for i in range(7):
+            Post.objects.create(author=cls.first, text=f'Первый {i}')
+            Post.objects.create(author=cls.second, text=f'Второй {i}')
+
+    def merged(self, posts=None):
+        posts = Post.objects.for_feed() if posts is None else posts
+        return shards.MergedQuerySet(
+            posts.on_author_shard(author.pk).filter(author=author)
+            for author in (self.first, self.second)
+        )
+
+    def test_cursor_pages_match_single_queryset(self):
+        expected = CursorPaginator(
+            Post.objects.for_feed().across_shards(), 4
+        )
+        merged = CursorPaginator(self.merged(), 4)
+        cursor = None
+        while True:
+            page = merged.get_cursor_page(cursor)
+            reference = expected.get_cursor_page(cursor)
+            self.assertEqual(list(page), list(reference))
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        previous = merged.get_cursor_page(page.previous_cursor)
+        self.assertEqual(
+            list(previous),
+            list(expected.get_cursor_page(page.previous_cursor)),
+        )
+
+    def test_authors_prefetched_once_per_page(self):
+        merged = self.merged(Post.objects.prefetch_related('author'))
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in connections
+            ]
+            rows = merged.order_by('-pub_date', '-pk')[:5]
+            self.assertEqual(
+                {post.author.username for post in rows}, {'first', 'second'}
+            )
+        # по запросу на выборку и один на авторов всей страницы
+        self.assertEqual(sum(len(queries) for queries in captured), 2 + 1)
+        self.assertEqual(self.merged().count(), 14)
+        self.assertTrue(self.merged().filter(text='Второй 6').exists())
+
+
+@override_settings(POST_SHARDS=['shard_a', 'shard_b', 'shard_c'])
+class ShardRoutingTest(TestCase):
+    def test_post_id_points_to_author_shard(self):
+        ids = set()
+        for author_id in range(1, 7):
+            post_id = shards.next_post_id(author_id)
+            ids.add(post_id)
+            self.assertEqual(
+                shards.shard_for_post(post_id),
+                shards.shard_for_author(author_id),
+            )
+        self.assertEqual(len(ids), 6)
+        self.assertIsNone(shards.shard_for_post(shards.SHARD_SLOTS - 1))
+
+    def test_router(self):
+        router = shards.ShardRouter()
+        author = User(pk=4)
+        post = Post(author=author)
+        self.assertEqual(router.db_for_write(Post, instance=post), 'shard_b')
+        post.pk = shards.SHARD_SLOTS * 10 + 2
+        self.assertEqual(router.db_for_read(Post, instance=post), 'shard_c')
+        comment = Comment(post=post)
+        self.assertEqual(
+            router.db_for_write(Comment, instance=comment), 'shard_c'
+        )
+        post._state.db = 'shard_c'
+        self.assertEqual(router.db_for_read(User, instance=post), 'default')
+        self.assertIsNone(router.db_for_read(Post))
+        self.assertTrue(router.allow_migrate('shard_a', 'posts'))
+        self.assertFalse(router.allow_migrate('shard_a', 'sessions'))
+
+
+@override_settings(POST_SHARDS=settings.TEST_POST_SHARDS)
+class ShardedPagesTest(TestCase):
+    """Страницы поверх нескольких баз SQLite."""
+
+    databases = {'default', *settings.TEST_POST_SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(4)
+        ]
+        cls.posts = [
+            Post.objects.create(author=author, text=f'Пост {author}')
+            for author in cls.authors
+        ]
+        for author in cls.authors[:2]:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def test_posts_live_on_their_author_shard(self):
+        used = set()
+        for post in self.posts:
+            alias = shards.shard_for_author(post.author_id)
+            used.add(alias)
+            self.assertTrue(
+                Post.objects.using(alias).filter(pk=post.pk).exists()
+            )
+        self.assertGreater(len(used), 1)
+        self.assertFalse(Post.objects.using('default').exists())
+
+    def test_feeds_merge_shards(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[::-1]
+        )
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[1::-1]
+        )
+        response = self.client.get(reverse(
+            'posts:profile', kwargs={'username': 'author1'}
+        ))
+        self.assertEqual(list(response.context['page_obj']), [self.posts[1]])
+        self.assertEqual(response.context['post_count'], 1)
+
+    def test_comment_goes_to_post_shard(self):
+        post = self.posts[3]
+        client = Client()
+        client.force_login(self.reader)
+        client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Комментарий'},
+        )
+        alias = shards.shard_for_post(post.pk)
+        self.assertEqual(Comment.objects.using(alias).count(), 1)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, 'Комментарий')
+        self.assertEqual(response.context['post'].comment_count, 1)
+        self.assertEqual(
+            stats.recount(self.reader.pk).comment_count, 1
+        )
@@ -0,0 +1,319 @@
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts import thumbnails
+from posts.models import MediaFile, Post, ThumbnailJob
+from posts.templatetags.post_images import picture
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+
+def make_image(name='photo.png', size=(40, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 10, 10)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PREGENERATE=True)
+class ThumbnailQueueTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='axx')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # KV-хранилище sorl кэширует миниатюры одинаковых картинок
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def create_post(self):
+        self.client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост с картинкой', 'image': make_image()},
+        )
+        return Post.objects.get(text='Пост с картинкой')
+
+    def test_upload_enqueues_job_and_page_shows_original(self):
+        """До нарезки страница отдаёт оригинал и не зовёт Pillow."""
+        post = self.create_post()
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.image, post.image.name)
+        self.assertEqual(job.status, ThumbnailJob.PENDING)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, post.image.url)
+        self.assertIsNone(thumbnails.ready_thumbnail(post.image))
+
+    def test_worker_generates_every_geometry(self):
+        """После воркера шаблоны отдают готовую миниатюру."""
+        post = self.create_post()
+        call_command('thumbnail_worker', once=True, stdout=StringIO())
+        self.assertEqual(
+            ThumbnailJob.objects.get().status, ThumbnailJob.DONE
+        )
+        for geometry, options in thumbnails.geometries():
+            with self.subTest(geometry=geometry):
+                self.assertIsNotNone(thumbnails.ready_thumbnail(
+                    post.image, geometry, options
+                ))
+        thumbnail = thumbnails.ready_thumbnail(post.image)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnail.url)
+        self.assertNotContains(response, post.image.url)
+        small = thumbnails.ready_thumbnail(
+            post.image, *thumbnails.feed_variant(480)
+        )
+        self.assertContains(
+            response, f'srcset="{small.url} 480w, {thumbnail.url} 960w"'
+        )
+
+    def test_image_variant_negotiates_format(self):
+        """Ссылка на вариант ведёт на миниатюру, а до нарезки — на оригинал."""
+        post = self.create_post()
+        url = reverse(
+            'posts:image_variant',
+            kwargs={'width': 480, 'name': post.image.name},
+        )
+        response = self.client.get(url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertRedirects(
+            response, post.image.url, fetch_redirect_response=False
+        )
+        self.assertEqual(response['Vary'], 'Accept')
+        call_command('thumbnail_worker', once=True, stdout=StringIO())
+        response = self.client.get(url, HTTP_ACCEPT='image/webp,*/*')
+        # WebP, если его умеет эта сборка Pillow, иначе JPEG
+        image_format = thumbnails.negotiate(
+            'image/webp,*/*', thumbnails.available_formats()
+        )
+        small = thumbnails.ready_thumbnail(
+            post.image, *thumbnails.feed_variant(480, image_format)
+        )
+        self.assertRedirects(
+            response, small.url, fetch_redirect_response=False
+        )
+        for width, name in ((100, post.image.name), (480, 'posts/x.png')):
+            with self.subTest(width=width, name=name):
+                response = self.client.get(reverse(
+                    'posts:image_variant',
+                    kwargs={'width': width, 'name': name},
+                ))
+                self.assertEqual(response.status_code, 404)
+
+    def test_duplicate_upload_shares_file_and_thumbnails(self):
+        first = self.create_post()
+        call_command('thumbnail_worker', once=True, stdout=StringIO())
+        first.text = 'Первый'
+        first.save()
+        second = self.create_post()
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertRegex(
+            first.image.name,
+            r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$',
+        )
+        # миниатюры общие — второй раз резать нечего
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).refs, 2
+        )
+        first.delete()
+        second.image = None
+        second.save()
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).refs, 0
+        )
+
+    def test_gc_media_removes_orphans_and_stale_thumbnails(self):
+        post = self.create_post()
+        call_command('thumbnail_worker', once=True, stdout=StringIO())
+        old_image = post.image.name
+        old_thumbnail = thumbnails.ready_thumbnail(post.image)
+        post.image = make_image(size=(50, 50))
+        post.save()
+        thumbnails.process(ThumbnailJob.objects.create(image=post.image))
+        extra = get_thumbnail(
+            thumbnails.source_file(post.image), '10x10'
+        )
+        storage = post.image.storage
+
+        out = StringIO()
+        call_command('gc_media', dry_run=True, grace_minutes=0, stdout=out)
+        self.assertIn(old_image, out.getvalue())
+        self.assertTrue(storage.exists(old_image))
+
+        call_command('gc_media', grace_minutes=0, stdout=out)
+        # все варианты старой картинки и лишняя геометрия новой
+        removed = len(thumbnails.geometries()) + 1
+        self.assertIn(
+            f'Удалено файлов: 1, миниатюр: {removed}', out.getvalue()
+        )
+        self.assertFalse(storage.exists(old_image))
+        self.assertFalse(old_thumbnail.exists())
+        self.assertFalse(extra.exists())
+        cache.clear()
+        self.assertIsNone(thumbnails.ready_thumbnail(old_image))
+        self.assertTrue(storage.exists(post.image.name))
+        for geometry, options in thumbnails.geometries():
+            thumbnail = thumbnails.ready_thumbnail(
+                post.image, geometry, options
+            )
+            self.assertTrue(thumbnail.exists())
+
+    def test_gc_media_spares_fresh_files(self):
+        post = self.create_post()
+        name = post.image.name
+        post.delete()
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
+
+    def test_gc_media_spares_reuploaded_orphan(self):
+        post = self.create_post()
+        name = post.image.name
+        post.delete()
+        storage = post.image.storage
+        os.utime(storage.path(name), (0, 0))
+        # загрузка записала файл, а пост ещё не закоммичен
+        self.assertEqual(storage.save('posts/photo.png', make_image()), name)
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(storage.exists(name))
+
+    def test_pending_thumbnail_is_not_cached_for_long(self):
+        """Отсутствие миниатюры помнится секунды, а не как готовая."""
+        post = Post.objects.create(
+            author=self.user, text='Ждёт', image='posts/pending.png'
+        )
+        with mock.patch.object(thumbnails, 'PENDING_TTL', 0.05):
+            self.assertIsNone(thumbnails.ready_thumbnail(post.image))
+        # воркер в другом процессе записал миниатюру в базу
+        thumbnail = thumbnails.thumbnail_file(post.image, *thumbnails.FEED)
+        thumbnail.set_size((960, 339))
+        KVStoreModel.objects.create(
+            key=add_prefix(thumbnail.key), value=thumbnail.serialize()
+        )
+        time.sleep(0.1)
+        self.assertEqual(
+            thumbnails.ready_thumbnail(post.image).name, thumbnail.name
+        )
+
+    @override_settings(THUMBNAIL_PREGENERATE=False)
+    def test_render_time_thumbnails_fall_back_to_original(self):
+        """Без общего кэша sorl режет при рендере; битый файл — оригинал."""
+        post = Post.objects.create(
+            author=self.user, text='Битая', image='posts/missing.png'
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, post.image.url)
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_stale_running_job_is_reclaimed(self):
+        job = ThumbnailJob.objects.create(
+            image='posts/missing.png', status=ThumbnailJob.RUNNING
+        )
+        self.assertIsNone(thumbnails.claim())
+        ThumbnailJob.objects.filter(pk=job.pk).update(
+            updated=job.updated - thumbnails.STALE_AFTER * 2
+        )
+        claimed = thumbnails.claim()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.attempts, 1)
+
+    def test_batched_lookup_matches_single_lookup(self):
+        post = self.create_post()
+        Post.objects.create(author=self.user, text='Без картинки')
+        call_command('thumbnail_worker', once=True, stdout=StringIO())
+        cache.clear()
+        ready = thumbnails.ready_thumbnails(
+            [post.image, Post.objects.get(text='Без картинки').image]
+        )
+        self.assertEqual(list(ready), [post.image.name])
+        self.assertEqual(
+            ready[post.image.name].url,
+            thumbnails.ready_thumbnail(post.image).url,
+        )
+
+
+class VariantFormatsTest(TestCase):
+    def test_available_formats_fall_back_to_jpeg(self):
+        with self.settings(THUMBNAIL_MODERN_FORMATS=('AVIF', 'BOGUS')):
+            self.assertEqual(thumbnails.available_formats(), ('JPEG',))
+
+    def test_negotiate(self):
+        formats = ['WEBP', 'JPEG']
+        cases = (
+            ('image/avif,image/webp,image/apng,*/*;q=0.8', 'WEBP'),
+            ('image/png,image/*;q=0.8', 'JPEG'),
+            ('', 'JPEG'),
+        )
+        for accept, expected in cases:
+            with self.subTest(accept=accept):
+                self.assertEqual(
+                    thumbnails.negotiate(accept, formats), expected
+                )
+        self.assertIsNone(thumbnails.negotiate('image/webp', []))
+
+    def test_picture_lists_modern_sources_first(self):
+        post = Post(text='т', image='posts/a.png')
+
+        def sizes(ext):
+            return [
+                (width, SimpleNamespace(url=f'/{width}.{ext}'))
+                for width in thumbnails.FEED_WIDTHS
+            ]
+
+        ready = {'WEBP': sizes('webp'), 'JPEG': sizes('jpg')}
+        context = picture(post, {'posts/a.png': ready})
+        self.assertEqual(context['img'].url, '/960.jpg')
+        self.assertEqual(context['sources'], [{
+            'type': 'image/webp', 'srcset': '/480.webp 480w, /960.webp 960w',
+        }])
+
+
+@override_settings(THUMBNAIL_PREGENERATE=True)
+class BatchedThumbnailQueriesTest(TestCase):
+    """Картинки страницы ищутся в KV-хранилище одним запросом."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='axx')
+
+    def create_posts(self, count):
+        Post.objects.bulk_create(
+            Post(author=self.user, text='Пост', image=f'posts/{i}.png')
+            for i in range(count)
+        )
+
+    def test_feed_page_queries_do_not_grow_with_images(self):
+        for count in (1, settings.POST_COUNT):
+            with self.subTest(count=count):
+                self.create_posts(count)
+                cache.clear()
+                # страница постов + один SELECT по KV-хранилищу
+                with self.assertNumQueries(2):
+                    self.client.get(reverse('posts:index'))
@@ -0,0 +1,77 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from posts import timeline
+from posts.models import Follow, Post, Timeline
+
+User = get_user_model()
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='axx')
+        cls.reader = User.objects.create_user(username='oxx')
+
+    def feed(self):
+        return list(
+            Timeline.objects.filter(user=self.reader)
+            .order_by('-pub_date', '-post_id')
+            .values_list('post_id', flat=True)
+        )
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новый пост попадает в ленту подписчика."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        self.assertEqual(self.feed(), [post.pk])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка достраивает ленту, отписка её вычищает."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed(), [post.pk for post in reversed(posts)])
+        follow.delete()
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_MAX_SIZE=2)
+    def test_timeline_size_is_capped(self):
+        """В ленте хранятся только TIMELINE_MAX_SIZE последних постов."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(4)
+        ]
+        self.assertEqual(self.feed(), [posts[3].pk, posts[2].pk])
+
+    @override_settings(TIMELINE_MAX_SIZE=1)
+    def test_fan_out_queries_do_not_grow_with_followers(self):
+        """Разнос и обрезка лент не делают запросов на каждого подписчика."""
+        for i in range(5):
+            reader = User.objects.create_user(username=f'reader{i}')
+            Follow.objects.create(user=reader, author=self.author)
+            post = Post.objects.create(author=self.author, text='Пост')
+        with CaptureQueriesContext(connection) as queries:
+            timeline.fan_out(post)
+        self.assertLessEqual(len(queries), 3)
+        self.assertEqual(
+            set(Timeline.objects.values_list('post_id', flat=True)),
+            {post.pk},
+        )
+
+    def test_rebuild_command(self):
+        """rebuild_timelines восстанавливает потерянные записи."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.feed(), [post.pk])
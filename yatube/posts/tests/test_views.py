@@ -5,11 +5,15 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
-from posts.models import Group, Post
+from posts import thumbnails
+from posts.models import Comment, Follow, Group, Post
+from posts.paginators import CursorPaginator
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -200,23 +204,61 @@ class TaskPagesTests(TestCase):
         """
         posts_content = self.authorized_client.get(
             reverse('posts:index')).content
-        Post.objects.create(
-            text='Testing cache text',
-            author=self.user,
-        )
+        # запись в обход сигналов не сбрасывает кэш
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
         posts_cached = self.authorized_client.get(
             reverse('posts:index')).content
         self.assertEqual(
             posts_content,
             posts_cached,
             'В кэш не было записи')
-        cache.clear()
+        Post.objects.create(
+            text='Testing cache text',
+            author=self.user,
+        )
         posts_non_cached = self.authorized_client.get(
             reverse('posts:index')).content
         self.assertNotEqual(
             posts_content,
             posts_non_cached,
-            'Кэш не очищен')
+            'Кэш не сброшен новым постом')
+        self.assertContains(
+            self.authorized_client.get(reverse('posts:index')),
+            'Testing cache text',
+        )
+
+    def test_feed_caches_invalidated_on_write(self):
+        """Правка поста сразу видна в лентах группы и автора."""
+        pages = (
+            reverse('posts:group_list', kwargs={'slug': 'test'}),
+            reverse('posts:profile', kwargs={'username': 'axx'}),
+        )
+        for url in pages:
+            self.authorized_client.get(url)
+        self.post.text = 'Отредактированный пост'
+        self.post.save()
+        for url in pages:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.authorized_client.get(url),
+                    'Отредактированный пост',
+                )
+
+    def test_feed_caches_invalidated_on_author_and_group_edit(self):
+        """Имя автора и slug группы в карточках ленты не устаревают."""
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Переименованный'
+        author.save()
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed'
+        group.save()
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Переименованный')
+        self.assertContains(
+            response, reverse('posts:group_list', args=('renamed',))
+        )
 
     def test_error_page(self):
         response = self.client.get('/nonexist-page/')
@@ -311,3 +353,327 @@ class PaginatorViewsTest(TestCase):
         response = self.authorized_client.get(
             reverse('posts:profile', kwargs={'username': 'axx'}) + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_cursor_pages_cover_all_records_once(self):
+        """Курсоры next/prev обходят ленту без пропусков и дублей."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url).context['page_obj']
+        self.assertIsNone(first.previous_cursor)
+        self.assertIsNotNone(first.next_cursor)
+        second = self.authorized_client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertIsNone(second.next_cursor)
+        seen = [post.pk for post in list(first) + list(second)]
+        self.assertEqual(len(set(seen)), 13)
+        back = self.authorized_client.get(
+            url, {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in back], [post.pk for post in first]
+        )
+        self.assertIsNone(back.previous_cursor)
+
+    def test_cursor_page_does_not_count(self):
+        """Курсорная страница не выполняет COUNT(*)."""
+        first = self.authorized_client.get(
+            reverse('posts:group_list', kwargs={'slug': 'test'})
+        ).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(
+                reverse('posts:group_list', kwargs={'slug': 'test'}),
+                {'cursor': first.next_cursor},
+            )
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries)
+        )
+
+    def test_page_past_the_end_shows_last_page(self):
+        cache.clear()
+        url = reverse('posts:index')
+        page_obj = self.authorized_client.get(
+            url, {'page': 999}).context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual(len(page_obj), 3)
+        response = self.authorized_client.get(url)
+        self.assertEqual(
+            response.content.decode().count('подробная информация'), 10
+        )
+
+    def test_empty_page_is_not_cached(self):
+        cache.clear()
+        url = reverse('posts:index')
+        last = Post.objects.order_by('pub_date', 'pk').first()
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        past_end = paginator.encode_cursor(last, 'n')
+        response = self.authorized_client.get(url, {'cursor': past_end})
+        self.assertEqual(len(response.context['page_obj']), 0)
+        for page in ({}, {'cursor': past_end}):
+            response = self.authorized_client.get(url, page)
+            self.assertEqual(
+                response.content.decode().count('подробная информация'),
+                len(response.context['page_obj']),
+            )
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': 'garbage'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+
+class FeedQueriesTest(TestCase):
+    """Число запросов на страницу ленты не зависит от числа постов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='axx')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def create_posts(self, count):
+        start = Post.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(username=f'author{i}')
+            Post.objects.create(author=author, text='Чужой пост')
+            Post.objects.create(
+                author=self.user, text='Тестовый пост', group=self.group
+            )
+
+    def assert_feed_queries(self):
+        pages = (
+            (self.client, reverse('posts:index'), 1),
+            (self.client, reverse(
+                'posts:group_list', kwargs={'slug': 'test'}), 2),
+            # автор со счётчиками + страница
+            (self.client, reverse(
+                'posts:profile', kwargs={'username': 'axx'}), 2),
+            # сессия и пользователь + лента подписок
+            (self.reader_client, reverse('posts:follow_index'), 3),
+        )
+        for client, url, queries in pages:
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertNumQueries(queries):
+                    client.get(url)
+
+    def test_feed_query_count_is_constant(self):
+        self.create_posts(1)
+        self.assert_feed_queries()
+        self.create_posts(settings.POST_COUNT)
+        self.assert_feed_queries()
+
+
+class ConditionalGetTest(TestCase):
+    """Неизменившиеся страницы отвечают 304 одним запросом к БД."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='cond', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group,
+            image='posts/cond.png',
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.urls = {
+            'post': reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}
+            ),
+            'profile': reverse(
+                'posts:profile', kwargs={'username': 'author'}
+            ),
+            'group': reverse('posts:group_list', kwargs={'slug': 'cond'}),
+        }
+
+    def etags(self):
+        return {
+            name: self.client.get(url)['ETag']
+            for name, url in self.urls.items()
+        }
+
+    def test_unchanged_pages_answer_304(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(url)
+                with self.assertNumQueries(1):
+                    cached = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(cached.status_code, 304)
+                cached = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                )
+                self.assertEqual(cached.status_code, 304)
+
+    def test_etag_depends_on_viewer(self):
+        url = self.urls['post']
+        self.assertNotEqual(
+            self.client.get(url)['ETag'],
+            self.reader_client.get(url)['ETag'],
+        )
+
+    def test_relogin_invalidates_page_with_csrf_form(self):
+        url = self.urls['post']
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(url)
+        client.logout()
+        client.get(url)
+        client.force_login(self.reader)
+        refreshed = client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(refreshed.status_code, 200)
+
+    def rename_author(self):
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Новое имя'
+        author.save()
+
+    def test_writes_change_etags(self):
+        writes = (
+            ('comment', lambda: self.post.comments.create(
+                author=self.reader, text='Комментарий'
+            ), {'post'}),
+            ('new post', lambda: Post.objects.create(
+                author=self.author, text='Ещё', group=self.group
+            ), {'post', 'profile', 'group'}),
+            ('follow', lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            ), {'post', 'profile'}),
+            ('rename', self.rename_author, {'post', 'profile', 'group'}),
+            ('thumbnails', lambda: thumbnails.changed(self.post.image), {
+                'post', 'profile', 'group'
+            }),
+        )
+        for name, write, changed in writes:
+            with self.subTest(write=name):
+                before = self.etags()
+                write()
+                after = self.etags()
+                self.assertEqual(
+                    {page for page in before if before[page] != after[page]},
+                    changed,
+                )
+
+
+@override_settings(COMMENT_COUNT=3)
+class CommentPaginationTest(TestCase):
+    """Комментарии идут страницами по курсору, авторы — одним JOIN."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        self.url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def add_comments(self, count):
+        for i in range(Comment.objects.count(), count):
+            self.post.comments.create(
+                author=User.objects.create_user(username=f'reader{i}'),
+                text=f'Комментарий {i}',
+            )
+
+    def test_query_count_does_not_grow_with_comments(self):
+        for count in (1, 7):
+            with self.subTest(comments=count):
+                self.add_comments(count)
+                # пост с автором и группой + страница комментариев
+                with self.assertNumQueries(2):
+                    response = self.client.get(self.url)
+                self.assertEqual(
+                    len(response.context['comments']), min(count, 3)
+                )
+                self.assertContains(response, f'Комментарии: {count}')
+
+    def test_load_more_fragment(self):
+        self.add_comments(5)
+        response = self.client.get(self.url)
+        cursor = response.context['comments'].next_cursor
+        fragment_url = reverse(
+            'posts:comment_list', kwargs={'post_id': self.post.pk}
+        )
+        self.assertContains(response, f'data-fragment="{fragment_url}?')
+        response = self.client.get(fragment_url, {'cursor': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertNotContains(response, '<html')
+        texts = [comment.text for comment in response.context['comments']]
+        self.assertEqual(texts, ['Комментарий 1', 'Комментарий 0'])
+        self.assertNotContains(response, 'data-fragment')
+        response = self.client.get(reverse(
+            'posts:comment_list', kwargs={'post_id': self.post.pk + 1}
+        ))
+        self.assertEqual(response.status_code, 404)
+
+    def test_comment_count_follows_writes(self):
+        self.add_comments(2)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+        Comment.objects.first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+
+@override_settings(THUMBNAIL_PREGENERATE=True)
+class PostDetailQueriesTest(TestCase):
+    """Страница поста укладывается в два запроса к БД."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='detail', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост',
+            group=cls.group,
+            image='posts/detail.png',
+        )
+        for i in range(3):
+            cls.post.comments.create(
+                author=User.objects.create_user(username=f'reader{i}'),
+                text='Комментарий',
+            )
+
+    def test_query_budget(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        reader = Client()
+        reader.force_login(User.objects.get(username='reader0'))
+        # пост с автором, счётчиками и группой + страница комментариев;
+        # читателю ещё сессия и пользователь
+        for client, queries in ((self.client, 2), (reader, 4)):
+            with self.subTest(authenticated=client is reader):
+                cache.clear()
+                # KV-хранилище миниатюр уже прогрето прошлыми показами
+                client.get(url)
+                with self.assertNumQueries(queries):
+                    response = client.get(url)
+                self.assertContains(response, 'Всего постов автора')
+                self.assertContains(response, self.group.title)
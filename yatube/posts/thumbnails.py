@@ -0,0 +1,315 @@
+"""Миниатюры картинок постов, нарезаемые заранее.
+
+Все геометрии, которые используют шаблоны, возвращает ``geometries()``.
+После загрузки картинки ``post_create``/``post_edit`` ставят задание в
+очередь ``ThumbnailJob``, а воркер ``manage.py thumbnail_worker`` режет
+миниатюры через sorl-thumbnail. Шаблоны только смотрят в KV-хранилище
+sorl и, пока миниатюры нет, показывают оригинал — рендер страницы никогда
+не запускает Pillow. Воркер — отдельный процесс, поэтому нарезка заранее
+(``THUMBNAIL_PREGENERATE``) требует общего кэша; без неё sorl режет
+миниатюры при рендере, как раньше.
+
+Для ленты режется несколько ширин ``FEED_WIDTHS`` в JPEG и в современных
+форматах из ``settings.THUMBNAIL_MODERN_FORMATS`` — тех, что умеют
+кодировать установленные Pillow и sorl. Шаблон отдаёт их через
+``<picture>``/``srcset``, и браузер сам выбирает ширину и формат.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.cache import bump_tags
+
+from . import shards, stats
+from .cache import post_tags
+from .models import Post, ThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+FEED_WIDTH, FEED_HEIGHT = 960, 339
+FEED_WIDTHS = (480, FEED_WIDTH)
+FEED = (f'{FEED_WIDTH}x{FEED_HEIGHT}', {'crop': 'center', 'upscale': True})
+FALLBACK_FORMAT = 'JPEG'
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+MAX_ATTEMPTS = 3
+# сколько секунд помнить, что миниатюры ещё нет: её вот-вот нарежет воркер
+PENDING_TTL = 5
+STALE_AFTER = timedelta(minutes=10)
+
+
+def available_formats():
+    """Форматы вариантов от лучшего к худшему; JPEG есть всегда."""
+    Image.init()
+    modern = tuple(
+        image_format for image_format in settings.THUMBNAIL_MODERN_FORMATS
+        if image_format in Image.SAVE and image_format in EXTENSIONS
+    )
+    return modern + (FALLBACK_FORMAT,)
+
+
+def feed_variant(width, image_format=FALLBACK_FORMAT):
+    """Геометрия и опции варианта ленты заданной ширины и формата."""
+    height = round(width * FEED_HEIGHT / FEED_WIDTH)
+    return f'{width}x{height}', {**FEED[1], 'format': image_format}
+
+
+def variants():
+    """``(формат, ширина, геометрия, опции)`` всех вариантов ленты."""
+    return [
+        (image_format, width, *feed_variant(width, image_format))
+        for image_format in available_formats()
+        for width in FEED_WIDTHS
+    ]
+
+
+def geometries():
+    """Все геометрии, которые режет воркер."""
+    return [(geometry, options) for _, _, geometry, options in variants()]
+
+
+def _full_options(source, options):
+    # те же умолчания, что подставляет ThumbnailBackend.get_thumbnail:
+    # от них зависит имя файла миниатюры
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def source_file(image):
+    """Исходник для sorl всегда в хранилище ``Post.image``.
+
+    От класса хранилища зависит ключ исходника, а значит, и имена
+    миниатюр: воркер и шаблоны должны получать один и тот же ключ,
+    передают ли они ``FieldFile`` или просто имя.
+    """
+    return ImageFile(str(image), Post._meta.get_field('image').storage)
+
+
+def thumbnail_file(image, geometry, options):
+    """Миниатюра без обращения к хранилищу — только имя."""
+    source = source_file(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _full_options(source, options)
+    )
+    return ImageFile(name, default.storage)
+
+
+def ready_thumbnail(image, geometry=FEED[0], options=FEED[1]):
+    """Готовая миниатюра из KV-хранилища или ``None``."""
+    if not image:
+        return None
+    return ready_thumbnails([image], geometry, options).get(str(image))
+
+
+def _ready_one(image, geometry, options):
+    if not settings.THUMBNAIL_PREGENERATE:
+        thumbnail = get_thumbnail(source_file(image), geometry, **options)
+        # sorl не смог нарезать (битый файл) — показываем оригинал
+        return thumbnail if thumbnail.size else None
+    return default.kvstore.get(thumbnail_file(image, geometry, options))
+
+
+def _image_file(value, storage_path):
+    data = deserialize(value)
+    if data['storage'] != storage_path:
+        return deserialize_image_file(value)
+    # одно хранилище на всю страницу вместо LazyStorage на каждую картинку
+    image_file = ImageFile(data['name'], default.storage)
+    image_file.set_size(data['size'])
+    return image_file
+
+
+def _get_many_raw(kvstore, keys):
+    """``get_many`` для cached_db KV-хранилища sorl: кэш, затем один SELECT.
+
+    Промахи кэшируются на ``PENDING_TTL``, а не на срок готовых миниатюр.
+    """
+    empty = cached_db_kvstore.EMPTY_VALUE
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(
+            KVStoreModel.objects.filter(key__in=missing)
+            .values_list('key', 'value')
+        )
+        kvstore.cache.set_many(
+            found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        pending = {key: empty for key in missing if key not in found}
+        kvstore.cache.set_many(pending, PENDING_TTL)
+        values.update(found)
+    return {key: value for key, value in values.items() if value != empty}
+
+
+def _ready(images, wanted):
+    """Готовые миниатюры ``{(имя картинки, номер в wanted): ImageFile}``.
+
+    Для cached_db KV-хранилища это один ``cache.get_many`` и не больше
+    одного запроса к БД на всю страницу, сколько бы ни было вариантов.
+    """
+    images = {str(image): image for image in images if image}
+    if not images:
+        return {}
+    if not settings.THUMBNAIL_PREGENERATE or not isinstance(
+        default.kvstore, cached_db_kvstore.KVStore
+    ):
+        found = {}
+        for name, image in images.items():
+            for index, (geometry, options) in enumerate(wanted):
+                thumbnail = _ready_one(image, geometry, options)
+                if thumbnail is not None:
+                    found[name, index] = thumbnail
+        return found
+    keys = {}
+    for name, image in images.items():
+        for index, (geometry, options) in enumerate(wanted):
+            thumbnail = thumbnail_file(image, geometry, options)
+            keys[add_prefix(thumbnail.key)] = (name, index)
+    storage_path = thumbnail.serialize_storage()
+    return {
+        keys[key]: _image_file(value, storage_path)
+        for key, value in _get_many_raw(default.kvstore, list(keys)).items()
+    }
+
+
+def ready_thumbnails(images, geometry=FEED[0], options=FEED[1]):
+    """Готовые миниатюры пачки картинок: ``{имя картинки: ImageFile}``."""
+    found = _ready(images, [(geometry, options)])
+    return {name: thumbnail for (name, _), thumbnail in found.items()}
+
+
+def ready_variants(images):
+    """Готовые варианты ленты пачки картинок.
+
+    ``{имя картинки: {формат: [(ширина, ImageFile), ...]}}``, ширины по
+    возрастанию; форматы, нарезанные не целиком, пропускаются.
+    """
+    wanted = variants()
+    found = _ready(images, [(g, o) for _, _, g, o in wanted])
+    ready = {}
+    for name in {name for name, _ in found}:
+        by_format = {}
+        for index, (image_format, width, _, _) in enumerate(wanted):
+            thumbnail = found.get((name, index))
+            if thumbnail is not None:
+                by_format.setdefault(image_format, []).append(
+                    (width, thumbnail)
+                )
+        ready[name] = {
+            image_format: sizes for image_format, sizes in by_format.items()
+            if len(sizes) == len(FEED_WIDTHS)
+        }
+    return ready
+
+
+def negotiate(accept, image_formats):
+    """Лучший из ``image_formats``, который клиент перечислил в Accept."""
+    accepted = {
+        part.split(';')[0].strip().lower() for part in accept.split(',')
+    }
+    for image_format in image_formats:
+        if MIME_TYPES[image_format] in accepted:
+            return image_format
+    return FALLBACK_FORMAT if FALLBACK_FORMAT in image_formats else None
+
+
+def enqueue(image):
+    if not image or not settings.THUMBNAIL_PREGENERATE:
+        return
+    if ready_variants([image]).get(str(image)):
+        # тот же файл уже загружали: миниатюры общие
+        return
+    ThumbnailJob.objects.get_or_create(
+        image=str(image), status=ThumbnailJob.PENDING
+    )
+
+
+def claim():
+    """Забирает самое старое задание; зависшие в работе берёт повторно."""
+    stale = timezone.now() - STALE_AFTER
+    candidates = ThumbnailJob.objects.filter(
+        Q(status=ThumbnailJob.PENDING)
+        | Q(status=ThumbnailJob.RUNNING, updated__lt=stale)
+    ).order_by('created')
+    for job in candidates[:10]:
+        claimed = ThumbnailJob.objects.filter(
+            pk=job.pk, status=job.status, updated=job.updated
+        ).update(
+            status=ThumbnailJob.RUNNING,
+            attempts=F('attempts') + 1,
+            updated=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def process(job):
+    try:
+        for geometry, options in geometries():
+            get_thumbnail(source_file(job.image), geometry, **options)
+    except Exception as error:
+        logger.exception('Не удалось нарезать миниатюры %s', job.image)
+        job.status = (
+            ThumbnailJob.FAILED if job.attempts >= MAX_ATTEMPTS
+            else ThumbnailJob.PENDING
+        )
+        job.error = str(error)
+    else:
+        job.status = ThumbnailJob.DONE
+    job.save(update_fields=['status', 'error', 'updated'])
+    if job.status == ThumbnailJob.DONE:
+        changed(job.image)
+    return job
+
+
+def changed(image):
+    """Страницы с картинкой показывают оригинал — пусть перерисуются.
+
+    Сбрасываются теги кэшей и ``updated_at``, от которых считаются ответы
+    304 страниц постов, их авторов и групп.
+    """
+    from .signals import touch_groups
+
+    posts = list(
+        Post.objects.across_shards().filter(image=image)
+        .only('author', 'group')
+    )
+    for post in posts:
+        bump_tags(*post_tags(post))
+    for alias in shards.aliases(Post):
+        Post.objects.using(alias).filter(image=image).update(
+            updated_at=timezone.now()
+        )
+    for author_id in {post.author_id for post in posts}:
+        stats.touch(author_id)
+    touch_groups(*{post.group_id for post in posts})
@@ -0,0 +1,132 @@
+"""Лента подписок с разносом при записи (fan-out on write).
+
+Каждый новый пост сразу раскладывается в ``Timeline`` подписчиков автора,
+а подписка и отписка достраивают или вычищают ленту читателя. Чтение
+``follow_index`` сводится к одному диапазону индекса ``(user, pub_date)``.
+Лента каждого пользователя ограничена ``TIMELINE_MAX_SIZE`` записями;
+после разноса поста ленты всех подписчиков обрезаются одним ``DELETE``,
+а не запросами на каждого подписчика.
+
+С шардами постов (``posts.shards``) ``Timeline`` не ведётся: посты
+подписок лежат в разных базах, и ``merged`` сливает их на чтении.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from . import shards
+from .models import Follow, Post, Timeline
+
+
+def max_size():
+    return settings.TIMELINE_MAX_SIZE
+
+
+def _entries(user_id, posts):
+    return [
+        Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    ]
+
+
+def as_posts(entries):
+    return [entry.post for entry in entries]
+
+
+def trim(user_id):
+    """Удаляет из ленты всё, что старше ``TIMELINE_MAX_SIZE`` записей."""
+    boundary = (
+        Timeline.objects.filter(user_id=user_id)
+        .order_by('-pub_date', '-post_id')
+        .values_list('pub_date', 'post_id')[max_size():max_size() + 1]
+    )
+    for pub_date, post_id in boundary:
+        Timeline.objects.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, post_id__lte=post_id),
+            user_id=user_id,
+        ).delete()
+
+
+def trim_followers(author_id):
+    """``trim`` для лент всех подписчиков автора одним запросом."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {Timeline._meta.db_table} WHERE id IN ('
+            ' SELECT id FROM ('
+            '  SELECT id, ROW_NUMBER() OVER ('
+            '   PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+            '  ) AS position'
+            f'  FROM {Timeline._meta.db_table}'
+            '  WHERE user_id IN ('
+            f'   SELECT user_id FROM {Follow._meta.db_table}'
+            '   WHERE author_id = %s'
+            '  )'
+            ' ) WHERE position > %s'
+            ')',
+            [author_id, max_size()],
+        )
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    follower_ids = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    Timeline.objects.bulk_create(
+        [
+            Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in follower_ids
+        ],
+        ignore_conflicts=True,
+    )
+    trim_followers(post.author_id)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту свежие посты автора после подписки."""
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-pk')
+        .values_list('pk', 'pub_date')[:max_size()]
+    )
+    Timeline.objects.bulk_create(
+        _entries(user_id, posts), ignore_conflicts=True
+    )
+    trim(user_id)
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    Timeline.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def merged(user_id):
+    """Посты подписок из шардов их авторов, слитые по дате."""
+    author_ids = list(
+        Follow.objects.filter(user_id=user_id)
+        .values_list('author_id', flat=True)
+    )
+    aliases = sorted({
+        shards.shard_for_author(author_id) for author_id in author_ids
+    })
+    if not aliases:
+        return Post.objects.none()
+    return (
+        Post.objects.for_feed().filter(author_id__in=author_ids)
+        .across_shards(aliases)
+    )
+
+
+def rebuild(user_id):
+    """Собирает ленту пользователя заново по его подпискам."""
+    Timeline.objects.filter(user_id=user_id).delete()
+    posts = (
+        Post.objects.filter(author__following__user_id=user_id)
+        .order_by('-pub_date', '-pk')
+        .values_list('pk', 'pub_date')[:max_size()]
+    )
+    Timeline.objects.bulk_create(_entries(user_id, posts))
@@ -1,44 +1,99 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.files.storage import default_storage
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
 
+from core.page_cache import tag_page
+
+from . import archive, shards, stats, thumbnails, timeline
+from .cache import (INDEX_TAG, author_tag, feed_cache, feed_reads, group_tag,
+                    post_tag)
+from .conditional import conditional_page, page_object
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import (
+    ArchivedComment, ArchivedPost, Comment, Follow, Group, Post, Timeline,
+    User,
+)
+from .paginators import paginate
+from .search import search_posts
 
 
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    tag_page(request, INDEX_TAG)
+    post_list = Post.objects.for_feed().across_shards()
+    with feed_reads(request, INDEX_TAG):
+        page_obj = paginate(request, post_list)
     context = {
         'page_obj': page_obj,
+        'feed_cache': feed_cache(INDEX_TAG, page_obj),
     }
     return render(request, 'posts/index.html', context)
 
 
+def get_group(slug):
+    return get_object_or_404(Group, slug=slug)
+
+
+def get_author(username):
+    return get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+
+
+def get_post(post_id):
+    try:
+        return Post.objects.for_detail().on_shard_of(post_id).get(pk=post_id)
+    except Post.DoesNotExist:
+        # старые посты переезжают в архив (posts.archive)
+        return get_object_or_404(
+            ArchivedPost.objects.for_detail().on_shard_of(post_id),
+            pk=post_id,
+        )
+
+
+def post_changed(post):
+    changed = [post.updated_at, stats.for_user(post.author).updated_at]
+    if post.group is not None:
+        changed.append(post.group.updated_at)
+    return max(changed)
+
+
+@conditional_page(get_group, lambda group: group.updated_at)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group)
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = page_object(request, get_group, slug=slug)
+    tag_page(request, group_tag(group.pk))
+    post_list = Post.objects.for_feed().filter(group=group).across_shards()
+    with feed_reads(request, group_tag(group.pk)):
+        page_obj = paginate(request, post_list)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_cache': feed_cache(group_tag(group.pk), page_obj),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(
+    get_author, lambda author: stats.for_user(author).updated_at
+)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = page_object(request, get_author, username=username)
+    tag_page(request, author_tag(author.pk))
     full_name = author.get_full_name()
-    post_list = Post.objects.filter(author=author)
-    post_count = post_list.count()
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author_stats = stats.for_user(author)
+    post_list = archive.with_archive(
+        Post.objects.for_feed().on_author_shard(author.pk)
+        .filter(author=author),
+        ArchivedPost.objects.for_feed().on_author_shard(author.pk)
+        .filter(author=author),
+        author_stats,
+    )
+    post_count = author_stats.post_count
+    with feed_reads(request, author_tag(author.pk)):
+        page_obj = paginate(request, post_list)
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user, author=author
@@ -51,18 +106,29 @@ def profile(request, username):
         'post_count': post_count,
         'page_obj': page_obj,
         'following': following,
+        'feed_cache': feed_cache(author_tag(author.pk), page_obj),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_page_tags(post):
+    # счётчик постов автора и название группы тоже на странице
+    tags = [post_tag(post.pk), author_tag(post.author_id)]
+    if post.group_id is not None:
+        tags.append(group_tag(post.group_id))
+    return tags
+
+
+@conditional_page(get_post, post_changed)
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, pk=post_id)
-    author = get_object_or_404(User, posts=post)
+    post = page_object(request, get_post, post_id=post_id)
+    tag_page(request, *post_page_tags(post))
+    author = post.author
     group = post.group
     full_name = author.get_full_name()
-    post_count = Post.objects.filter(author=author).count()
-    comments = post.comments.all()
+    post_count = stats.for_user(author).post_count
+    comments = paginate_comments(request, post.pk, post.is_archived)
     context = {
         'post': post,
         'group': group,
@@ -75,6 +141,76 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def paginate_comments(request, post_id, archived=False):
+    """Страница комментариев поста, новые сверху."""
+    model = ArchivedComment if archived else Comment
+    return paginate(
+        request,
+        model.objects.for_page().for_post(post_id),
+        per_page=settings.COMMENT_COUNT,
+        ordering=('-created', '-pk'),
+    )
+
+
+@require_safe
+def comment_list(request, post_id):
+    """HTML-фрагмент следующей страницы комментариев для кнопки «Ещё»."""
+    tag_page(request, post_tag(post_id))
+    comments = paginate_comments(request, post_id)
+    if not comments and not (
+        Post.objects.on_shard_of(post_id).filter(pk=post_id).exists()
+    ):
+        comments = paginate_comments(request, post_id, archived=True)
+        if not comments and not (
+            ArchivedPost.objects.on_shard_of(post_id)
+            .filter(pk=post_id).exists()
+        ):
+            raise Http404
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    post_list, ordering = search_posts(
+        query, Post.objects.for_feed().across_shards()
+    )
+    page_obj = paginate(request, post_list, ordering=ordering)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@require_safe
+def image_variant(request, width, name):
+    """Вариант картинки поста нужной ширины в лучшем формате из Accept.
+
+    Для ссылок вне ``<picture>`` (RSS, письма): редиректит на готовую
+    миниатюру, а пока её нет — на оригинал. Ответ зависит от Accept.
+    """
+    if width not in thumbnails.FEED_WIDTHS or not (
+        Post.objects.across_shards().filter(image=name).exists()
+    ):
+        raise Http404
+    by_format = thumbnails.ready_variants([name]).get(name, {})
+    image_format = thumbnails.negotiate(
+        request.headers.get('Accept', ''), list(by_format)
+    )
+    if image_format is None:
+        response = redirect(default_storage.url(name))
+        patch_cache_control(response, max_age=60)
+    else:
+        response = redirect(dict(by_format[image_format])[width].url)
+        patch_cache_control(response, public=True, max_age=60 * 60 * 24)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -86,6 +222,7 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            thumbnails.enqueue(post.image)
             return redirect('posts:profile', post.author)
     else:
         form = PostForm()
@@ -98,7 +235,7 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.on_shard_of(post_id), pk=post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
@@ -109,6 +246,8 @@ def post_edit(request, post_id):
     if form.is_valid():
         post = form.save(commit=False)
         post.save()
+        if 'image' in form.changed_data:
+            thumbnails.enqueue(post.image)
         return redirect('posts:post_detail', post_id)
     context = {
         "form": form,
@@ -119,7 +258,7 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.on_shard_of(post_id), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -131,10 +270,16 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, settings.POST_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if shards.enabled():
+        page_obj = paginate(request, timeline.merged(request.user.pk))
+    else:
+        entries = Timeline.objects.for_feed().filter(user=request.user)
+        page_obj = paginate(
+            request,
+            entries,
+            ordering=('-pub_date', '-post_id'),
+            transform=timeline.as_posts,
+        )
     context = {
         'page_obj': page_obj,
     }
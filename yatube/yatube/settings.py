@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -51,6 +53,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.replicas.ReplicaPinMiddleware',
+    'core.page_cache.PageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,7 +93,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # соединение переживает запрос и не открывается заново
+        'CONN_MAX_AGE': int(os.getenv('YATUBE_CONN_MAX_AGE', 60)),
+    }
+}
+
+# реплики только для чтения: пути к копиям SQLite через запятую, их
+# обновляет manage.py refresh_replicas (core.replicas)
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('YATUBE_DB_REPLICAS', '').split(','))
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': replica.strip(),
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS.append(alias)
+
+# посты и комментарии по шардам автора: пути к SQLite-файлам через
+# запятую (posts.shards); пустой список — всё в default
+POST_SHARDS = []
+for number, shard in enumerate(
+    filter(None, os.getenv('YATUBE_POST_SHARDS', '').split(','))
+):
+    alias = f'posts_shard{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': shard.strip()}
+    POST_SHARDS.append(alias)
+
+# шарды для тестов (posts.tests.test_shards подставляет их в POST_SHARDS):
+# соединения ленивые, а тестовые базы в памяти создаются только для
+# тестов, которые их объявили. Остальные тесты рассчитаны на пустой
+# YATUBE_POST_SHARDS
+TEST_POST_SHARDS = ['posts_shard_test0', 'posts_shard_test1']
+for alias in TEST_POST_SHARDS:
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': ':memory:'}
+
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'core.replicas.ReplicaRouter',
+]
+# чтения этих приложений в GET-запросах идут на реплики
+REPLICA_APPS = ('posts', 'users', 'about')
+# после записи клиент столько секунд читает с основной базы
+REPLICA_PIN_COOKIE = 'yatube_primary'
+REPLICA_PIN_SECONDS = int(os.getenv('YATUBE_REPLICA_PIN_SECONDS', 10))
+
+# выполняются на каждом новом соединении SQLite (core.db); busy_timeout в
+# миллисекундах, mmap_size в байтах, отрицательный cache_size — в КиБ
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('YATUBE_SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('YATUBE_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('YATUBE_SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.getenv('YATUBE_SQLITE_MMAP_SIZE', 256 * 2 ** 20)),
+    'cache_size': int(os.getenv('YATUBE_SQLITE_CACHE_SIZE', -64 * 1024)),
+    'temp_store': os.getenv('YATUBE_SQLITE_TEMP_STORE', 'MEMORY'),
 }
 
 
@@ -135,6 +194,12 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 POST_COUNT = 10
 
+# комментариев на странице поста и в одной подгрузке «Ещё»
+COMMENT_COUNT = 20
+
+# сколько последних постов хранится в ленте подписок одного пользователя
+TIMELINE_MAX_SIZE = 1000
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -150,8 +215,80 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# кто читает медиафайлы с диска: Django (None), nginx ('x-accel-redirect')
+# или Apache/lighttpd ('x-sendfile'); для nginx MEDIA_ACCEL_PREFIX —
+# internal-location, смотрящий в MEDIA_ROOT
+MEDIA_ACCEL = os.getenv('YATUBE_MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = os.getenv(
+    'YATUBE_MEDIA_ACCEL_PREFIX', '/protected-media/'
+)
+
+# загружаемые картинки: больше IMAGE_MAX_PIXELS не декодируются вовсе,
+# длинная сторона хранимого оригинала не больше IMAGE_MAX_SIDE
+IMAGE_MAX_PIXELS = 50_000_000
+IMAGE_MAX_SIDE = 2560
+IMAGE_JPEG_QUALITY = 85
+
+# варианты ленты в этих форматах режутся, если их умеет Pillow;
+# JPEG режется всегда
+THUMBNAIL_MODERN_FORMATS = ('AVIF', 'WEBP')
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# общий для всех воркеров кэш в файле SQLite: YATUBE_CACHE=sqlite
+if os.getenv('YATUBE_CACHE') == 'sqlite':
+    CACHES['default'] = {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('YATUBE_CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+
+# кэш общий для всех процессов: только тогда запись и сброс тегов в одном
+# воркере видят остальные (LocMemCache у каждого процесса свой)
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# миниатюры режет воркер `manage.py thumbnail_worker`, а не рендер страницы;
+# воркер — отдельный процесс, поэтому нужен общий кэш
+THUMBNAIL_PREGENERATE = os.getenv(
+    'YATUBE_THUMBNAIL_PREGENERATE', '1' if SHARED_CACHE else '0'
+) == '1'
+if THUMBNAIL_PREGENERATE and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        'THUMBNAIL_PREGENERATE требует общего кэша: YATUBE_CACHE=sqlite'
+    )
+
+# ключи фрагментов лент версионируются и сбрасываются сигналами при записи,
+# поэтому с общим кэшем жить они могут долго; в кэше отдельного процесса
+# сброс из других воркеров не виден, и фрагмент живёт 20 секунд
+FEED_CACHE_TIMEOUT = 60 * 60 * 6 if SHARED_CACHE else 20
+
+# устаревшая запись кэша ещё столько живёт, чтобы её можно было отдать,
+# пока один процесс считает свежую; остальные ждут свежую не дольше
+# CACHE_WAIT_TIMEOUT, если отдавать нечего
+CACHE_STALE_TTL = 60 * 5
+CACHE_WAIT_TIMEOUT = 2
+
+# целые страницы для анонимов (core.page_cache); в разработке выключен,
+# чтобы тесты и отладка видели контекст шаблона. Страницы сбрасываются
+# тегами и single-flight держится на cache.add, поэтому нужен общий кэш
+PAGE_CACHE_ENABLED = os.getenv(
+    'YATUBE_PAGE_CACHE', '1' if SHARED_CACHE and not DEBUG else '0'
+) == '1'
+if PAGE_CACHE_ENABLED and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        'PAGE_CACHE_ENABLED требует общего кэша: YATUBE_CACHE=sqlite'
+    )
+PAGE_CACHE_TIMEOUT = 60 * 60
+# сколько кэш перед приложением может держать страницу без очистки
+PAGE_CACHE_SHARED_MAX_AGE = 60